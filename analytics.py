@@ -1,7 +1,11 @@
+import math
 import pandas as pd
 import numpy as np
-from scipy.stats import norm
 from datetime import datetime
+from metrics import timed, counter, histogram
+
+IV_ITERATIONS = histogram('iv_solver_iterations', 'Newton-Raphson iterations per IV solve', buckets=(1, 2, 3, 5, 8, 13, 21, 50, 100))
+IV_FAILURES = counter('iv_solver_failures_total', 'IV solves that did not converge')
 
 def calculate_pcr(df):
     total_ce_oi = df['CE_OI'].sum()
@@ -9,6 +13,7 @@ def calculate_pcr(df):
     pcr = total_pe_oi / total_ce_oi if total_ce_oi > 0 else 0
     return pcr, total_ce_oi, total_pe_oi
 
+@timed('analytics_max_pain_seconds', 'calculate_max_pain latency')
 def calculate_max_pain(df):
     strikes = df.index.values
     ce_oi = df['CE_OI'].values
@@ -46,24 +51,83 @@ def classify_oi_buildup(price_change, oi_change):
     else:
         return "Neutral"
 
+def expiry_datetime(expiry):
+    # Expiry strings use the instrument master format, e.g. 23OCT26; expiry is taken as 15:30 IST.
+    # None when the string cannot be parsed
+    try:
+        return datetime.strptime(str(expiry), "%d%b%y").replace(hour=15, minute=30)
+    except ValueError:
+        return None
+
+def is_expired(expiry, now=None):
+    expiry_dt = expiry_datetime(expiry)
+    return expiry_dt is not None and expiry_dt <= (now or datetime.now())
+
+def years_to_expiry(expiry, default_days=7, now=None):
+    expiry_dt = expiry_datetime(expiry)
+    if expiry_dt is None:
+        days = default_days
+    else:
+        days = (expiry_dt - (now or datetime.now())).total_seconds() / 86400
+    return max(days / 365.0, 0.0001)
+
+# Standard normal CDF/PDF without scipy: math.erf for scalars, a vectorized erf for arrays
+_SQRT2 = math.sqrt(2.0)
+_INV_SQRT_2PI = 1.0 / math.sqrt(2.0 * math.pi)
+
+def _erf_vec(x):
+    # Abramowitz & Stegun 7.1.26, absolute error < 1.5e-7
+    a = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * a)
+    poly = ((((1.061405429 * t - 1.453152027) * t + 1.421413741) * t - 0.284496736) * t + 0.254829592) * t
+    return np.sign(x) * (1.0 - poly * np.exp(-a * a))
+
+def norm_cdf(x):
+    if np.ndim(x) == 0:
+        return 0.5 * (1.0 + math.erf(float(x) / _SQRT2))
+    return 0.5 * (1.0 + _erf_vec(np.asarray(x, dtype=float) / _SQRT2))
+
+def norm_pdf(x):
+    if np.ndim(x) == 0:
+        return math.exp(-0.5 * float(x) ** 2) * _INV_SQRT_2PI
+    return np.exp(-0.5 * np.square(x)) * _INV_SQRT_2PI
+
 # Basic Black-Scholes for IV and Greeks
 def black_scholes(S, K, T, r, sigma, option_type='CE'):
     if T <= 0: return 0, 0, 0, 0, 0
     d1 = (np.log(S / K) + (r + 0.5 * sigma ** 2) * T) / (sigma * np.sqrt(T))
     d2 = d1 - sigma * np.sqrt(T)
     if option_type == 'CE':
-        price = S * norm.cdf(d1) - K * np.exp(-r * T) * norm.cdf(d2)
-        delta = norm.cdf(d1)
+        price = S * norm_cdf(d1) - K * np.exp(-r * T) * norm_cdf(d2)
+        delta = norm_cdf(d1)
     else:
-        price = K * np.exp(-r * T) * norm.cdf(-d2) - S * norm.cdf(-d1)
-        delta = norm.cdf(d1) - 1
+        price = K * np.exp(-r * T) * norm_cdf(-d2) - S * norm_cdf(-d1)
+        delta = norm_cdf(d1) - 1
     
-    gamma = norm.pdf(d1) / (S * sigma * np.sqrt(T))
-    vega = S * norm.pdf(d1) * np.sqrt(T)
-    theta = -(S * norm.pdf(d1) * sigma) / (2 * np.sqrt(T)) - r * K * np.exp(-r * T) * norm.cdf(d2 if option_type == 'CE' else -d2)
+    gamma = norm_pdf(d1) / (S * sigma * np.sqrt(T))
+    vega = S * norm_pdf(d1) * np.sqrt(T)
+    theta = -(S * norm_pdf(d1) * sigma) / (2 * np.sqrt(T)) - r * K * np.exp(-r * T) * norm_cdf(d2 if option_type == 'CE' else -d2)
     
     return price, delta, gamma, vega, theta
 
+# Vectorized Black-Scholes: all inputs broadcast against each other, is_call is a boolean array
+def black_scholes_vec(S, K, T, r, sigma, is_call):
+    S, K, T, sigma = np.asarray(S, dtype=float), np.asarray(K, dtype=float), np.asarray(T, dtype=float), np.asarray(sigma, dtype=float)
+    is_call = np.asarray(is_call, dtype=bool)
+    sqrt_t = np.sqrt(T)
+    d1 = (np.log(S / K) + (r + 0.5 * sigma ** 2) * T) / (sigma * sqrt_t)
+    d2 = d1 - sigma * sqrt_t
+    disc_k = K * np.exp(-r * T)
+    pdf_d1 = norm_pdf(d1)
+
+    price = np.where(is_call, S * norm_cdf(d1) - disc_k * norm_cdf(d2), disc_k * norm_cdf(-d2) - S * norm_cdf(-d1))
+    delta = np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1)
+    gamma = pdf_d1 / (S * sigma * sqrt_t)
+    vega = S * pdf_d1 * sqrt_t
+    theta = -(S * pdf_d1 * sigma) / (2 * sqrt_t) - r * disc_k * norm_cdf(np.where(is_call, d2, -d2))
+
+    return price, delta, gamma, vega, theta
+
 def find_iv(market_price, S, K, T, r, option_type='CE'):
     # Newton-Raphson to find IV
     sigma = 0.2
@@ -71,8 +135,55 @@ def find_iv(market_price, S, K, T, r, option_type='CE'):
         price, delta, gamma, vega, theta = black_scholes(S, K, T, r, sigma, option_type)
         diff = market_price - price
         if abs(diff) < 0.01:
+            IV_ITERATIONS.observe(i + 1)
             return sigma
         if vega == 0: break
         sigma = sigma + diff / vega
         if sigma <= 0: sigma = 0.01
+    IV_ITERATIONS.observe(i + 1)
+    IV_FAILURES.inc()
     return sigma
+
+def find_iv_vec(market_price, S, K, T, r, is_call, max_iter=100, tol=0.01):
+    # Vectorized Newton-Raphson with the same start, tolerance and floor as find_iv;
+    # each iteration only reprices the contracts that have not converged yet
+    market_price, S, K, T = [np.asarray(a, dtype=float).ravel() for a in np.broadcast_arrays(market_price, S, K, T)]
+    is_call = np.broadcast_to(np.asarray(is_call, dtype=bool), market_price.shape).ravel()
+    sigma = np.full(market_price.shape, 0.2)
+    iterations = np.zeros(market_price.shape, dtype=int)
+    converged = np.zeros(market_price.shape, dtype=bool)
+    active = np.arange(market_price.size)
+
+    with np.errstate(all='ignore'):
+        for _ in range(max_iter):
+            if active.size == 0:
+                break
+            price, _, _, vega, _ = black_scholes_vec(S[active], K[active], T[active], r, sigma[active], is_call[active])
+            diff = market_price[active] - price
+            iterations[active] += 1
+            done = np.abs(diff) < tol
+            stalled = ~done & ((vega == 0) | ~np.isfinite(vega))
+            converged[active[done]] = True
+            step = ~done & ~stalled
+            new_sigma = sigma[active[step]] + diff[step] / vega[step]
+            sigma[active[step]] = np.where(new_sigma <= 0, 0.01, new_sigma)
+            active = active[step]
+
+    IV_ITERATIONS.observe_many(iterations)
+    IV_FAILURES.inc(int((~converged).sum()))
+    return sigma, converged
+
+def chain_greeks(spot, strikes, ce_ltp, pe_ltp, T, r=0.07):
+    # IV and delta for a whole chain; NaN where there is no LTP yet
+    n = len(strikes)
+    ltp = np.concatenate([ce_ltp, pe_ltp])
+    K = np.concatenate([strikes, strikes])
+    is_call = np.arange(2 * n) < n
+    iv = np.full(2 * n, np.nan)
+    delta = np.full(2 * n, np.nan)
+    valid = ltp > 0
+    if valid.any():
+        iv[valid], _ = find_iv_vec(ltp[valid], spot, K[valid], T, r, is_call[valid])
+        with np.errstate(all='ignore'):
+            _, delta[valid], _, _, _ = black_scholes_vec(spot, K[valid], T, r, iv[valid], is_call[valid])
+    return iv[:n], delta[:n], iv[n:], delta[n:]
@@ -1,24 +1,56 @@
 import streamlit as st
 import pandas as pd
 import time
+from concurrent.futures import ThreadPoolExecutor
 from kotak_api import KotakNeoClient
-from option_chain import OptionChainManager
+from option_chain import OptionChainManager, list_expiries
+from parallel import ParallelAnalytics
 from analytics import calculate_pcr, calculate_max_pain, get_support_resistance
-from ui_components import render_metric_cards, render_option_chain_table, render_oi_charts, render_oi_heatmap
+from ui_components import build_option_chain_table, build_oi_figures, build_oi_heatmap
+from ui_components import render_metric_cards, render_option_chain_table, render_oi_charts, render_oi_heatmap, render_scenario_heatmap, render_portfolio, render_metrics_panel, render_history
+from portfolio import PortfolioManager
+from history_store import open_store
 from live_data import LiveDataManager
+from metrics import REGISTRY, timed, start_metrics_server
 import config
 
 st.set_page_config(page_title="Kotak Neo Live Options Dashboard", layout="wide", initial_sidebar_state="expanded")
 
+# Prometheus text endpoint on localhost (started once per process)
+start_metrics_server()
+
+@st.cache_resource
+def get_parallel_analytics():
+    # One process pool for all sessions
+    return ParallelAnalytics(max_workers=config.ANALYTICS_WORKERS or None)
+
+@st.cache_resource
+def get_history_store():
+    return open_store()
+
 # Initialize Session State
 if 'client' not in st.session_state:
     st.session_state.client = KotakNeoClient(config)
 if 'managers' not in st.session_state:
-    st.session_state.managers = {index: OptionChainManager(index) for index in config.INDICES}
+    st.session_state.managers = {} # (index, expiry) -> OptionChainManager, filled by initialize_chains
+if 'token_routes' not in st.session_state:
+    st.session_state.token_routes = {} # token -> managers that consume it
 if 'initialized' not in st.session_state:
     st.session_state.initialized = False
 if 'last_update' not in st.session_state:
     st.session_state.last_update = time.time()
+if 'ldm_version' not in st.session_state:
+    st.session_state.ldm_version = 0 # last LiveDataManager version applied to the managers
+if 'greeks_key' not in st.session_state:
+    st.session_state.greeks_key = {} # (index, expiry) -> (chain version, days) greeks were computed for
+if 'analytics_cache' not in st.session_state:
+    st.session_state.analytics_cache = {} # (index, expiry) -> (chain version, analytics)
+if 'view_cache' not in st.session_state:
+    st.session_state.view_cache = {} # ((index, expiry), view part) -> (chain version, styled table / figures)
+if 'portfolio' not in st.session_state:
+    st.session_state.portfolio = PortfolioManager()
+if 'init_future' not in st.session_state:
+    st.session_state.init_future = None # background chain initialization
 
 # Sidebar
 st.sidebar.title("🚀 Kotak Neo Options")
@@ -44,72 +76,173 @@ if not st.session_state.client.is_logged_in:
             if success:
                 st.sidebar.success(msg)
                 st.session_state.initialized = False # Trigger re-init
+                st.session_state.init_future = None
+                st.session_state.managers = {}
+                st.session_state.token_routes = {}
             else:
                 st.sidebar.error(msg)
 
+def initialize_chains(client, managers, routes, portfolio):
+    # Runs on a worker thread so the first paint is not blocked; touches no st.* state
+    instruments = client.get_instruments()
+    for index in config.INDICES:
+        spot = config.DEMO_SPOT_PRICES[index] # Default/Fetch spot (config validates INDICES against this table)
+        for expiry in list_expiries(instruments, index)[:config.EXPIRIES_PER_INDEX]:
+            manager = OptionChainManager(index)
+            manager.initialize_chain(instruments, spot, expiry)
+            managers[(index, expiry)] = manager
+
+            # Subscribe to tokens; the underlying's ticks go to every chain of the index
+            tokens = [t for t in manager.full_chain[['CE_token', 'PE_token']].values.ravel() if pd.notnull(t)]
+            for token in tokens + [index]:
+                routes.setdefault(token, []).append(manager)
+            client.subscribe_quotes(tokens, manager.update_tick)
+
+    # Positions are mapped to chain rows once; ticks then update them incrementally
+    portfolio.load_positions(client.get_positions(), managers)
+
 if st.session_state.client.is_logged_in and not st.session_state.initialized:
-    with st.spinner("Fetching instruments and initializing..."):
-        instruments = st.session_state.client.get_instruments()
-        for index in config.INDICES:
-            spot = 22000 if index == "NIFTY" else 47000 # Default/Fetch spot
-            st.session_state.managers[index].initialize_chain(instruments, spot)
-            
-            # Subscribe to tokens
-            tokens = []
-            df = st.session_state.managers[index].full_chain
-            for _, row in df.iterrows():
-                if pd.notnull(row['CE_token']): tokens.append(row['CE_token'])
-                if pd.notnull(row['PE_token']): tokens.append(row['PE_token'])
-            
-            def make_callback(idx):
-                def callback(tick):
-                    st.session_state.managers[idx].update_tick(tick)
-                return callback
-            
-            st.session_state.client.subscribe_quotes(tokens, make_callback(index))
-            
+    future = st.session_state.init_future
+    if future is None:
+        executor = ThreadPoolExecutor(max_workers=1)
+        st.session_state.init_future = executor.submit(initialize_chains, st.session_state.client, st.session_state.managers,
+                                                       st.session_state.token_routes, st.session_state.portfolio)
+        executor.shutdown(wait=False)
+    elif future.done() and future.exception() is None:
         st.session_state.initialized = True
 
-# Main Dashboard
-if st.session_state.client.is_logged_in:
-    selected_index = st.sidebar.selectbox("Select Index", config.INDICES)
-    days_to_expiry = st.sidebar.number_input("Days to Expiry", value=7, min_value=1, max_value=365)
-    manager = st.session_state.managers[selected_index]
-    
-    # Update manager with latest ticks from LiveDataManager
+@timed('app_sync_ticks_seconds', 'Applying new ticks to the chain managers and portfolio')
+def sync_ticks():
+    # Apply only the ticks that arrived since the last sync
     ldm = LiveDataManager()
-    ticks = ldm.get_all_ticks()
-    for token, tick in ticks.items():
-        manager.update_tick(tick)
-    
-    # Calculate Greeks periodically (e.g., every 5 seconds to save CPU)
-    if time.time() - st.session_state.last_update > 5:
-        manager.calculate_greeks(t_days=days_to_expiry)
-        st.session_state.last_update = time.time()
-        
-    # Analytics
+    if ldm.get_version() == st.session_state.ldm_version:
+        return # nothing ticked since the last refresh
+    version, updates = ldm.get_updates_since(st.session_state.ldm_version)
+    routes = st.session_state.token_routes
+    for token, tick in updates.items():
+        for manager in routes.get(token, ()):
+            manager.update_tick(tick)
+        st.session_state.portfolio.on_tick(tick)
+    st.session_state.ldm_version = version
+
+def get_analytics(key, manager):
+    # Recompute PCR / Max Pain / S&R only when the chain has changed
+    cached = st.session_state.analytics_cache.get(key)
+    if cached and cached[0] == manager.version:
+        return cached[1]
     df = manager.full_chain
     pcr, total_ce, total_pe = calculate_pcr(df)
     max_pain = calculate_max_pain(df)
     support, resistance = get_support_resistance(df)
-    
-    # Header
-    st.title(f"📊 {selected_index} Real-Time Dashboard")
-    
+    analytics = {'pcr': pcr, 'max_pain': max_pain, 'support': support, 'resistance': resistance}
+    st.session_state.analytics_cache[key] = (manager.version, analytics)
+    return analytics
+
+def get_view_part(key, manager, part, build):
+    # Styled tables and figures are rebuilt only when the chain has changed (ticks, ATM move or new Greeks)
+    cached = st.session_state.view_cache.get((key, part))
+    if cached and cached[0] == manager.version:
+        return cached[1]
+    value = build()
+    st.session_state.view_cache[(key, part)] = (manager.version, value)
+    return value
+
+def update_greeks(days_override):
+    # Greeks for every (index, expiry) chain that moved, sharded across the process pool
+    t_days = days_override or None
+    stale = {key: m for key, m in st.session_state.managers.items()
+             if st.session_state.greeks_key.get(key) != (m.version, days_override)}
+    if stale:
+        get_parallel_analytics().calculate_greeks(stale.values(), t_days=t_days)
+        for key, m in stale.items():
+            st.session_state.greeks_key[key] = (m.version, days_override)
+
+def record_history():
+    # Snapshot every chain once a minute; OI closes for every expiry, other rollups only from the nearest expiry of each index
+    store = get_history_store()
+    if store is None:
+        return
+    seen = set()
+    for (index, expiry), manager in st.session_state.managers.items():
+        store.maybe_record(manager, rollups=index not in seen)
+        seen.add(index)
+
+def render_history_view(index, expiry):
+    store = get_history_store()
+    if store is None:
+        st.info("History recording is disabled (set HISTORY_DIR).")
+        return
+    sessions = st.slider("Sessions", 1, 20, 5, key="history_sessions")
+    render_history(store.atm_iv_percentile(index), store.oi_change_by_strike(index, sessions, expiry),
+                   store.pcr_by_time_of_day(index), store.intraday(index), sessions)
+
+def render_scenarios(manager, days_override):
+    # Imported on first use so the scenario engine only loads when this view is opened
+    from scenario import ScenarioEngine, grid_slice
+    if 'scenario_engine' not in st.session_state:
+        # Large grids run on the process-wide pool rather than a per-session one
+        st.session_state.scenario_engine = ScenarioEngine(analytics=get_parallel_analytics())
+
+    st.subheader("What-if P&L")
+    # Default basket: open positions on this index, else a long ATM straddle of one unit each.
+    # Seeded once per chain: the editor's identity includes its data, so rebuilding it from the live ATM
+    # on every refresh would reset the user's edits
+    editor_key = f"scenario_legs_{manager.index_symbol}_{manager.expiry}"
+    if f"{editor_key}_seed" not in st.session_state:
+        st.session_state[f"{editor_key}_seed"] = pd.DataFrame(st.session_state.portfolio.get_scenario_legs(manager.index_symbol, manager.expiry) or [
+            {'strike': manager.atm_strike, 'option_type': 'CE', 'qty': 1},
+            {'strike': manager.atm_strike, 'option_type': 'PE', 'qty': 1},
+        ])
+    legs = st.data_editor(st.session_state[f"{editor_key}_seed"], num_rows="dynamic", key=editor_key,
+                          column_config={'option_type': st.column_config.SelectboxColumn(options=['CE', 'PE'])})
+    iv_shock = st.slider("IV Shock (vol points)", -10, 10, 0, key="scenario_iv_shock")
+
+    result = st.session_state.scenario_engine.run(manager, legs.dropna().to_dict('records'), t_days=days_override or None)
+    render_scenario_heatmap(grid_slice(result, 'pnl', iv_shock / 100))
+
+VIEWS = ["Option Chain", "OI Analytics", "Alerts & Signals", "Scenarios", "Portfolio", "History"]
+
+def render_timer(component):
+    return timed('ui_render_seconds', 'Render latency per dashboard component', {'component': component})
+
+@st.fragment(run_every=config.UPDATE_INTERVAL)
+@timed('ui_refresh_cycle_seconds', 'Full live view refresh cycle')
+def render_live_view(chain_key, days_override, show_metrics=False):
+    # Only this fragment reruns on the refresh timer; the sidebar and imports do not
+    sync_ticks()
+    manager = st.session_state.managers[chain_key]
+
+    # Calculate Greeks periodically (e.g., every 5 seconds to save CPU), only for chains that moved
+    if time.time() - st.session_state.last_update > 5:
+        update_greeks(days_override)
+        st.session_state.portfolio.resync() # theta/vega follow the decaying time to expiry
+        st.session_state.last_update = time.time()
+    record_history()
+
+    # Analytics
+    df = manager.full_chain
+    analytics = get_analytics(chain_key, manager)
+    pcr = analytics['pcr']
+
     # Metrics
-    render_metric_cards(manager.spot_price, manager.atm_strike, pcr, max_pain, support, resistance)
-    
-    # Layout
-    tab1, tab2, tab3 = st.tabs(["Option Chain", "OI Analytics", "Alerts & Signals"])
-    
-    with tab1:
-        render_option_chain_table(manager.get_display_chain(), manager.atm_strike)
-        
-    with tab2:
-        render_oi_charts(df)
-        render_oi_heatmap(df)
-        
-    with tab3:
+    with render_timer('metric_cards'):
+        render_metric_cards(manager.spot_price, manager.atm_strike, pcr, analytics['max_pain'],
+                            analytics['support'], analytics['resistance'])
+
+    # Layout: only the selected view runs (st.tabs would execute every tab body, and import plotly, on each refresh)
+    view = st.radio("View", VIEWS, horizontal=True, label_visibility="collapsed", key="view")
+
+    if view == "Option Chain":
+        with render_timer('option_chain'):
+            render_option_chain_table(get_view_part(chain_key, manager, 'chain_table',
+                                                    lambda: build_option_chain_table(manager.get_display_chain(), manager.atm_strike)))
+
+    elif view == "OI Analytics":
+        with render_timer('oi_charts'):
+            render_oi_charts(get_view_part(chain_key, manager, 'oi_figures', lambda: build_oi_figures(df)))
+            render_oi_heatmap(get_view_part(chain_key, manager, 'oi_heatmap', lambda: build_oi_heatmap(df)))
+
+    elif view == "Alerts & Signals":
         st.subheader("Smart Alerts")
         if pcr > 1.2:
             st.warning(f"Bullish sentiment detected: PCR is {pcr:.2f}")
@@ -117,13 +250,68 @@ if st.session_state.client.is_logged_in:
             st.error(f"Bearish sentiment detected: PCR is {pcr:.2f}")
         else:
             st.info("Sentiment is Neutral")
-            
+
         # Major OI Shift
         st.info("No major OI shifts detected in last 5 mins (Demo)")
 
-    # Auto-refresh logic
-    time.sleep(config.UPDATE_INTERVAL)
-    st.rerun()
+    elif view == "Scenarios":
+        with render_timer('scenarios'):
+            render_scenarios(manager, days_override)
+
+    elif view == "Portfolio":
+        with render_timer('portfolio'):
+            portfolio = st.session_state.portfolio
+            if portfolio.positions:
+                render_portfolio(portfolio.get_summary(), portfolio.get_legs_frame())
+            else:
+                st.info("No open option positions.")
+
+    elif view == "History":
+        with render_timer('history'):
+            render_history_view(manager.index_symbol, manager.expiry)
+
+    # Fragments cannot write to the sidebar, so the debug panel sits below the view
+    if show_metrics:
+        with st.expander("Metrics", expanded=True):
+            render_metrics_panel(REGISTRY.snapshot())
+
+@st.fragment(run_every=0.5)
+def render_init_status():
+    # Polls the background initialization; a full rerun on completion shows the live view, or the error if it failed
+    future = st.session_state.init_future
+    if future is not None and future.done():
+        st.rerun()
+    st.info("Fetching instruments and initializing option chains...")
+
+# Main Dashboard
+if st.session_state.client.is_logged_in:
+    selected_index = st.sidebar.selectbox("Select Index", config.INDICES)
+    selected_expiry = None
+    if st.session_state.initialized:
+        # managers is filled by the background init, so it is only read once that has finished
+        expiries = [expiry for index, expiry in st.session_state.managers if index == selected_index]
+        selected_expiry = st.sidebar.selectbox("Expiry", expiries)
+    days_override = st.sidebar.number_input("Days to Expiry (0 = from contract)", value=0, min_value=0, max_value=365)
+    show_metrics = st.sidebar.toggle("Metrics Debug Panel", value=False)
+
+    # Header
+    st.title(f"📊 {selected_index} Real-Time Dashboard")
+
+    if st.session_state.initialized and (selected_index, selected_expiry) in st.session_state.managers:
+        # Auto-refresh is driven by the fragment's timer instead of sleep + full rerun
+        render_live_view((selected_index, selected_expiry), days_override, show_metrics)
+    elif st.session_state.initialized:
+        st.warning(f"No option chain available for {selected_index}.")
+    elif st.session_state.init_future is not None and st.session_state.init_future.done():
+        # Init failed (initialized is set on success); show the error here rather than polling forever
+        st.error(f"Initialization failed: {st.session_state.init_future.exception()}")
+        if st.button("Retry"):
+            st.session_state.init_future = None
+            st.session_state.managers = {}
+            st.session_state.token_routes = {}
+            st.rerun()
+    else:
+        render_init_status()
 
 else:
     st.warning("Please login or enable Demo Mode to view the dashboard.")
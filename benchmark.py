@@ -0,0 +1,349 @@
+"""
+Headless benchmark for the tick -> screen pipeline.
+
+Drives synthetic (or recorded) ticks through LiveDataManager, OptionChainManager,
+analytics and ui_components data prep at several chain sizes, and reports per-stage
+throughput, p50/p99 latency and peak RSS. Results are written as JSON so runs can be
+compared between versions:
+
+    python benchmark.py --strikes 10 50 200 --output bench.json
+    python benchmark.py --strikes 10 50 200 --compare bench.json
+    python benchmark.py --startup --output startup.json
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import platform
+import subprocess
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import config
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def summarize(durations, items_per_call=1):
+    d = np.asarray(durations)
+    total = d.sum()
+    return {
+        'calls': int(len(d)),
+        'throughput_per_sec': float(len(d) * items_per_call / total) if total > 0 else None,
+        'mean_us': float(d.mean() * 1e6),
+        'p50_us': float(np.percentile(d, 50) * 1e6),
+        'p99_us': float(np.percentile(d, 99) * 1e6),
+        'max_us': float(d.max() * 1e6),
+    }
+
+def timed_calls(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+def timed_wrapper_cost_us(n=200000, rounds=5):
+    # Direct cost of one metrics.timed() wrapper: a wrapped no-op against the bare no-op, best of rounds.
+    # Best-of timing is robust to scheduler noise that swamps whole-pass comparisons on a busy host
+    from metrics import MetricsRegistry
+    noop = lambda: None
+    wrapped = MetricsRegistry().timed('noop_seconds')(noop)
+    def best(fn):
+        times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(n):
+                fn()
+            times.append(time.perf_counter() - start)
+        return min(times)
+    return (best(wrapped) - best(noop)) / n * 1e6
+
+def load_recorded_ticks(path, batch_size):
+    # JSON lines, one tick per line, replayed in batches of batch_size
+    with open(path) as f:
+        ticks = [json.loads(line) for line in f if line.strip()]
+    return [ticks[i:i + batch_size] for i in range(0, len(ticks), batch_size)]
+
+def bench_config(strikes, expiries):
+    # Copy of config with the chain size overridden
+    cfg = types.SimpleNamespace(**{k: getattr(config, k) for k in dir(config) if k.isupper()})
+    cfg.DEMO_MODE = True
+    cfg.DEMO_STRIKES = strikes
+    cfg.DEMO_EXPIRIES = expiries
+    return cfg
+
+def run_size(strikes, expiries=1, n_batches=200, batch_size=500, repeat=20, ticks_path=None, workers=None, metric_passes=5):
+    # Imported here so each isolated worker pays its own import cost and RSS
+    from kotak_api import KotakNeoClient
+    from live_data import LiveDataManager
+    from option_chain import OptionChainManager, list_expiries
+    from parallel import ParallelAnalytics
+    from simulator import MarketSimulator
+    from analytics import calculate_pcr, calculate_max_pain, get_support_resistance
+    import ui_components
+    from metrics import REGISTRY
+
+    cfg = bench_config(strikes, expiries)
+    stages = {}
+
+    instruments = KotakNeoClient(cfg)._generate_mock_instruments()
+    # One manager per (index, expiry), with ticks routed by token as in the app
+    managers = {(index, expiry): OptionChainManager(index) for index in cfg.INDICES for expiry in list_expiries(instruments, index)}
+    def reset_chains():
+        for (index, expiry), manager in managers.items():
+            manager.initialize_chain(instruments, cfg.DEMO_SPOT_PRICES[index], expiry)
+    stages['initialize_chain'] = summarize(timed_calls(reset_chains, max(1, repeat // 4)))
+    routes = {}
+    for (index, _), manager in managers.items():
+        for token in list(manager.token_map) + [index]:
+            routes.setdefault(token, []).append(manager)
+
+    if ticks_path:
+        batches = load_recorded_ticks(ticks_path, batch_size)
+    else:
+        sim = MarketSimulator(instruments, cfg.DEMO_SPOT_PRICES, seed=42)
+        sim.subscribe(instruments['instrument_token'])
+        batches = list(sim.generate(n_batches, batch_size))
+    n_ticks = sum(len(b) for b in batches)
+
+    # Feed ingest: batched writes into the shared tick store
+    ldm = LiveDataManager()
+    durations = []
+    for batch in batches:
+        start = time.perf_counter()
+        ldm.update_ticks(batch)
+        durations.append(time.perf_counter() - start)
+    stages['ldm_update_ticks'] = summarize(durations, n_ticks / len(batches))
+
+    # Per-tick chain updates, as the app applies them
+    def apply_ticks():
+        durations = []
+        for batch in batches:
+            for tick in batch:
+                start = time.perf_counter()
+                for manager in routes.get(tick['token'], ()):
+                    manager.update_tick(tick)
+                durations.append(time.perf_counter() - start)
+        return durations
+
+    # Instrumentation overhead: interleaved passes with metrics on and off, each replaying the same ticks
+    # on freshly reset chains (alternating which goes first), reported as the median per-pair difference
+    metrics_enabled = REGISTRY.enabled
+    durations, uninstrumented, overheads = [], [], []
+    for i in range(metric_passes):
+        totals = {}
+        for enabled in ((False, True) if i % 2 == 0 else (True, False)):
+            reset_chains()
+            REGISTRY.enabled = enabled
+            run = apply_ticks()
+            (durations if enabled else uninstrumented).extend(run)
+            totals[enabled] = sum(run)
+        overheads.append((totals[True] / totals[False] - 1) * 100)
+    REGISTRY.enabled = metrics_enabled
+    stages['update_tick'] = summarize(durations)
+    stages['update_tick_no_metrics'] = summarize(uninstrumented)
+    metrics_overhead_pct = float(np.median(overheads))
+    metrics_overhead_range = [float(min(overheads)), float(max(overheads))]
+    # update_tick carries one timed() wrapper, so its cost over the uninstrumented p50 bounds the overhead
+    wrapper_us = timed_wrapper_cost_us()
+    metrics_overhead_direct = wrapper_us / stages['update_tick_no_metrics']['p50_us'] * 100
+
+    # Sync cycle: diff since last version, then apply
+    version = 0
+    durations = []
+    for batch in batches:
+        ldm.update_ticks(batch)
+        start = time.perf_counter()
+        version, updates = ldm.get_updates_since(version)
+        for token, tick in updates.items():
+            for manager in routes.get(token, ()):
+                manager.update_tick(tick)
+        durations.append(time.perf_counter() - start)
+    stages['sync_cycle'] = summarize(durations)
+
+    # Greeks over every (index, expiry) chain: in-process vs sharded across the process pool
+    chain_rows = sum(len(m.full_chain) for m in managers.values()) * 2
+    serial = ParallelAnalytics(max_workers=1)
+    pool = ParallelAnalytics(max_workers=workers, min_rows=0)
+    pool.calculate_greeks(managers.values()) # warm up the workers
+    stages['greeks_all_chains_serial'] = summarize(timed_calls(lambda: serial.calculate_greeks(managers.values()), max(1, repeat // 4)), chain_rows)
+    stages['greeks_all_chains_parallel'] = summarize(timed_calls(lambda: pool.calculate_greeks(managers.values()), max(1, repeat // 4)), chain_rows)
+    pool.shutdown()
+    parallel_speedup = stages['greeks_all_chains_serial']['p50_us'] / stages['greeks_all_chains_parallel']['p50_us']
+
+    manager = next(iter(managers.values()))
+    df = manager.full_chain
+    stages['calculate_greeks'] = summarize(timed_calls(lambda: manager.calculate_greeks(), max(1, repeat // 4)), len(df) * 2)
+    stages['calculate_pcr'] = summarize(timed_calls(lambda: calculate_pcr(df), repeat))
+    stages['calculate_max_pain'] = summarize(timed_calls(lambda: calculate_max_pain(df), repeat))
+    stages['get_support_resistance'] = summarize(timed_calls(lambda: get_support_resistance(df), repeat))
+    stages['ui_option_chain_table'] = summarize(timed_calls(
+        lambda: ui_components.prepare_option_chain_table(manager.get_display_chain()), repeat))
+    stages['ui_oi_figures'] = summarize(timed_calls(lambda: (ui_components.build_oi_figures(df), ui_components.build_oi_heatmap(df)), repeat))
+
+    return {
+        'strikes_per_side': strikes,
+        'expiries': expiries,
+        'batch_size': batch_size,
+        'ticks_source': os.path.basename(ticks_path) if ticks_path else 'simulator',
+        'contracts': int(len(instruments)),
+        'chain_rows': int(len(df)),
+        'ticks': int(n_ticks),
+        'stages': stages,
+        'metrics_overhead_pct': metrics_overhead_pct,
+        'metrics_overhead_range_pct': metrics_overhead_range,
+        'timed_wrapper_us': float(wrapper_us),
+        'metrics_overhead_direct_pct': float(metrics_overhead_direct),
+        'parallel_workers': pool.max_workers,
+        'parallel_speedup': float(parallel_speedup),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+# Cold-start measurements; each runs in a fresh interpreter
+STARTUP_IMPORTS = {
+    'streamlit': 'import streamlit',
+    'pandas': 'import pandas',
+    'plotly': 'import plotly.express, plotly.graph_objects',
+    'scipy.stats': 'import scipy.stats',
+    'app_modules': 'import analytics, option_chain, live_data, kotak_api, portfolio, ui_components',
+}
+FIRST_RENDER = (
+    "from streamlit.testing.v1 import AppTest\n"
+    "at = AppTest.from_file('app.py', default_timeout=60)\n"
+    "at.run()\n"
+)
+
+def time_in_subprocess(code):
+    # Wall time of `code` in a fresh interpreter, excluding interpreter startup
+    wrapper = f"import time\n_t = time.perf_counter()\n{code}\nprint(time.perf_counter() - _t)"
+    try:
+        out = subprocess.check_output([sys.executable, '-c', wrapper], text=True, stderr=subprocess.DEVNULL,
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+        return float(out.strip().splitlines()[-1])
+    except (subprocess.CalledProcessError, ValueError, IndexError):
+        return None
+
+def run_startup(repeat=3):
+    def median_time(code):
+        times = [t for t in (time_in_subprocess(code) for _ in range(repeat)) if t is not None]
+        return float(np.median(times)) if times else None
+    return {
+        'import_seconds': {name: median_time(code) for name, code in STARTUP_IMPORTS.items()},
+        'first_render_seconds': median_time(FIRST_RENDER),
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def run_key(r):
+    # Results are only comparable for the same workload; older reports lack some fields and never match
+    return (r['strikes_per_side'], r.get('expiries'), r.get('batch_size'), r.get('ticks_source'))
+
+def compare(results, baseline_path, threshold=0.2):
+    # Flags stages whose p50 grew by more than threshold against a previous run of the same workload;
+    # returns (regressions, keys of results with no matching baseline)
+    with open(baseline_path) as f:
+        baseline = {run_key(r): r for r in json.load(f)['results']}
+    regressions, unmatched = [], []
+    for r in results:
+        base = baseline.get(run_key(r))
+        if base is None:
+            unmatched.append(run_key(r))
+            continue
+        for stage, stats in r['stages'].items():
+            old = base['stages'].get(stage)
+            if old and old['p50_us'] > 0 and stats['p50_us'] > old['p50_us'] * (1 + threshold):
+                regressions.append((r['strikes_per_side'], stage, old['p50_us'], stats['p50_us']))
+    return regressions, unmatched
+
+def print_results(results):
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.1f} MB" if r['peak_rss_mb'] is not None else "n/a"
+        print(f"\n== {r['strikes_per_side']} strikes/side, {r['contracts']} contracts, {r['ticks']} ticks, peak RSS {rss}, "
+              f"metrics overhead on update_tick {r['metrics_overhead_pct']:+.1f}% (median of pairs, range "
+              f"{r['metrics_overhead_range_pct'][0]:+.1f}..{r['metrics_overhead_range_pct'][1]:+.1f}%), "
+              f"{r['timed_wrapper_us']:.2f} us/call = {r['metrics_overhead_direct_pct']:.1f}% of p50 (direct), "
+              f"Greeks speedup {r['parallel_speedup']:.2f}x on {r['parallel_workers']} workers")
+        print(f"{'stage':<24}{'calls':>8}{'per sec':>14}{'p50 us':>12}{'p99 us':>12}")
+        for stage, s in r['stages'].items():
+            print(f"{stage:<24}{s['calls']:>8}{s['throughput_per_sec'] or 0:>14,.0f}{s['p50_us']:>12,.1f}{s['p99_us']:>12,.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the tick -> screen pipeline headlessly")
+    parser.add_argument('--strikes', type=int, nargs='+', default=[10, 50, 200], help="strikes per side of ATM")
+    parser.add_argument('--expiries', type=int, default=1, help="expiries per index")
+    parser.add_argument('--workers', type=int, help="process pool size for the parallel Greeks stage (default: CPU count)")
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--metric-passes', type=int, default=5, help="interleaved on/off pairs for the metrics overhead")
+    parser.add_argument('--ticks', help="replay recorded ticks (JSON lines) instead of the simulator")
+    parser.add_argument('--no-isolate', action='store_true', help="run all sizes in this process (RSS is then cumulative)")
+    parser.add_argument('--output', help="write results as JSON")
+    parser.add_argument('--compare', help="previous JSON results to check for p50 regressions")
+    parser.add_argument('--threshold', type=float, default=0.2, help="regression threshold for --compare")
+    parser.add_argument('--startup', action='store_true', help="measure import time and time-to-first-render instead")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        startup = run_startup()
+        for name, t in startup['import_seconds'].items():
+            print(f"import {name:<16}{'not installed' if t is None else f'{t * 1000:,.0f} ms'}")
+        t = startup['first_render_seconds']
+        print(f"first render (app.py) {'failed' if t is None else f'{t * 1000:,.0f} ms'}")
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'revision': git_revision(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                           'python': platform.python_version(), 'startup': startup}, f, indent=2)
+        return 0
+
+    results = []
+    for strikes in args.strikes:
+        kwargs = dict(strikes=strikes, expiries=args.expiries, n_batches=args.batches,
+                      batch_size=args.batch_size, repeat=args.repeat, ticks_path=args.ticks, workers=args.workers,
+                      metric_passes=args.metric_passes)
+        if args.no_isolate:
+            results.append(run_size(**kwargs))
+        else:
+            # Fresh process per size so peak RSS belongs to that size alone
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                results.append(pool.submit(run_size, **kwargs).result())
+
+    print_results(results)
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        regressions, unmatched = compare(results, args.compare, args.threshold)
+        for strikes, expiries, batch_size, ticks in unmatched:
+            print(f"No baseline for {strikes} strikes/side, {expiries} expiries, batch {batch_size}, ticks from {ticks}; not compared")
+        for strikes, stage, old, new in regressions:
+            print(f"REGRESSION {strikes} strikes/side {stage}: p50 {old:,.1f}us -> {new:,.1f}us")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,10 +14,30 @@ UCC = os.getenv("KOTAK_UCC", "your_ucc")
 # Application Settings
 DEMO_MODE = os.getenv("DEMO_MODE", "True").lower() == "true"
 UPDATE_INTERVAL = 1 # seconds
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108")) # Prometheus text on http://127.0.0.1:<port>/metrics, 0 disables
+POSITIONS_FILE = os.getenv("POSITIONS_FILE", "demo_positions.json") # positions used in demo mode
+HISTORY_DIR = os.getenv("HISTORY_DIR", "history") # end-of-minute snapshots and rollups (Parquet), empty disables
 
 # Trading Constants
-INDICES = ["NIFTY", "BANKNIFTY"]
+INDICES = [i.strip().upper() for i in os.getenv("INDICES", "NIFTY,BANKNIFTY").split(",") if i.strip()] # e.g. NIFTY,BANKNIFTY,FINNIFTY,MIDCPNIFTY,SENSEX
 EXPIRY_TYPE = "WEEKLY" # or "MONTHLY"
+EXPIRIES_PER_INDEX = int(os.getenv("EXPIRIES_PER_INDEX", "2")) # nearest expiries tracked per index
+STRIKE_STEPS = {"NIFTY": 50, "BANKNIFTY": 100, "FINNIFTY": 50, "MIDCPNIFTY": 25, "SENSEX": 100}
+LOT_SIZES = {"NIFTY": 50, "BANKNIFTY": 15, "FINNIFTY": 40, "MIDCPNIFTY": 75, "SENSEX": 10}
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", "0")) # process pool size for Greeks, 0 = CPU count
+
+# Demo / Simulator Settings
+DEMO_SPOT_PRICES = {"NIFTY": 22000, "BANKNIFTY": 47000, "FINNIFTY": 21000, "MIDCPNIFTY": 10500, "SENSEX": 73000}
+DEMO_EXPIRIES = int(os.getenv("DEMO_EXPIRIES", "4")) # weekly expiries per index
+DEMO_STRIKES = int(os.getenv("DEMO_STRIKES", "20")) # strikes on each side of ATM
+DEMO_TICK_RATE = int(os.getenv("DEMO_TICK_RATE", "500")) # ticks/sec emitted by the simulator
+DEMO_BATCH_INTERVAL = 0.1 # seconds between simulator batches
+
+# Every index needs a strike step, lot size and starting spot; a missing spot would start the chain at 0 (log(S/K) = -inf)
+_unknown = [i for i in INDICES if i not in STRIKE_STEPS or i not in LOT_SIZES or i not in DEMO_SPOT_PRICES]
+if _unknown:
+    raise ValueError(f"Unsupported INDICES {_unknown}; choose from {', '.join(STRIKE_STEPS)}")
 
 # UI Settings
 THEME_COLOR = "#1E1E1E"
@@ -2,8 +2,9 @@ import streamlit as st
 import pandas as pd
 import time
 from fetcher import NSEFetcher
-from utils import clean_data, update_history, get_top_gainers, get_top_losers
-import plotly.express as px
+from utils import clean_data, update_history, data_signature, get_top_gainers, get_top_losers
+from history_store import open_store
+import config
 
 st.set_page_config(page_title="NSE Live Dashboard", layout="wide")
 
@@ -14,6 +15,14 @@ if 'history' not in st.session_state:
     st.session_state.history = pd.DataFrame()
 if 'last_update_time' not in st.session_state:
     st.session_state.last_update_time = None
+if 'data_signature' not in st.session_state:
+    st.session_state.data_signature = None
+if 'view_cache' not in st.session_state:
+    st.session_state.view_cache = {} # view part -> (view key, figures / styled table)
+
+@st.cache_resource
+def get_history_store():
+    return open_store()
 
 # Sidebar Controls
 st.sidebar.title("NSE Dashboard Settings")
@@ -22,6 +31,7 @@ index_choice = st.sidebar.selectbox(
     ["NIFTY 50", "NIFTY NEXT 50", "NIFTY BANK", "NIFTY IT", "NIFTY AUTO", "NIFTY PHARMA"]
 )
 refresh_interval = st.sidebar.slider("Refresh Interval (seconds)", 5, 60, 10)
+history_days = st.sidebar.slider("Stored History (days)", 1, 30, 5)
 
 if st.sidebar.button("Clear History"):
     st.session_state.history = pd.DataFrame()
@@ -35,79 +45,121 @@ def load_data():
     df_raw = st.session_state.fetcher.fetch_equity_market_data(index_choice)
     df_cleaned = clean_data(df_raw)
     if not df_cleaned.empty:
-        st.session_state.history = update_history(st.session_state.history, df_cleaned)
-        st.session_state.last_update_time = time.strftime('%H:%M:%S')
+        # Only extend history when the snapshot actually changed
+        signature = data_signature(df_cleaned)
+        if signature != st.session_state.data_signature:
+            st.session_state.history = update_history(st.session_state.history, df_cleaned)
+            st.session_state.data_signature = signature
+            st.session_state.last_update_time = time.strftime('%H:%M:%S')
+            store = get_history_store()
+            if store is not None:
+                store.record_equity(index_choice, df_cleaned)
         return df_cleaned
     return pd.DataFrame()
 
-df = load_data()
-
-if not df.empty:
-    # Top Row Metrics
-    m1, m2, m3, m4 = st.columns(4)
-    
-    avg_pchange = df['pChange'].mean()
-    m1.metric("Avg % Change", f"{avg_pchange:.2f}%")
-    
-    gainer = get_top_gainers(df, 1).iloc[0]
-    m2.metric("Top Gainer", gainer['symbol'], f"{gainer['pChange']}%")
-    
-    loser = get_top_losers(df, 1).iloc[0]
-    m3.metric("Top Loser", loser['symbol'], f"{loser['pChange']}%")
-    
-    m4.metric("Last Update", st.session_state.last_update_time)
-
-    # Historical Trends
-    st.divider()
-    st.subheader("Performance Trends")
-    
-    if len(st.session_state.history) > 0:
-        # Filter history for top symbols to keep chart clean
-        top_symbols = get_top_gainers(df, 5)['symbol'].tolist()
-        plot_data = st.session_state.history[st.session_state.history['symbol'].isin(top_symbols)]
-        
-        col_c1, col_c2 = st.columns(2)
-        
-        with col_c1:
-            fig_price = px.line(
-                plot_data, x='fetchTimestamp', y='lastPrice', color='symbol',
-                title="Price Trend (Top 5 Current Gainers)",
-                labels={'fetchTimestamp': 'Time', 'lastPrice': 'Price'}
-            )
-            st.plotly_chart(fig_price, width='stretch')
-            
-        with col_c2:
-            fig_pchange = px.line(
-                plot_data, x='fetchTimestamp', y='pChange', color='symbol',
-                title="% Change Trend (Top 5 Current Gainers)",
-                labels={'fetchTimestamp': 'Time', 'pChange': '% Change'}
-            )
-            st.plotly_chart(fig_pchange, width='stretch')
-    else:
-        st.info("Collecting historical data points for trends...")
+def get_view_part(part, build, extra=None):
+    # Figures and the styled table are rebuilt only when the snapshot, index, history or stored range changed
+    key = (index_choice, st.session_state.data_signature, len(st.session_state.history), history_days, extra)
+    cached = st.session_state.view_cache.get(part)
+    if cached and cached[0] == key:
+        return cached[1]
+    value = build()
+    st.session_state.view_cache[part] = (key, value)
+    return value
+
+def build_trend_figures(df):
+    import plotly.express as px
+
+    # Filter history for top symbols to keep chart clean
+    top_symbols = get_top_gainers(df, 5)['symbol'].tolist()
+    plot_data = st.session_state.history[st.session_state.history['symbol'].isin(top_symbols)]
+    fig_price = px.line(
+        plot_data, x='fetchTimestamp', y='lastPrice', color='symbol',
+        title="Price Trend (Top 5 Current Gainers)",
+        labels={'fetchTimestamp': 'Time', 'lastPrice': 'Price'}
+    )
+    fig_pchange = px.line(
+        plot_data, x='fetchTimestamp', y='pChange', color='symbol',
+        title="% Change Trend (Top 5 Current Gainers)",
+        labels={'fetchTimestamp': 'Time', 'pChange': '% Change'}
+    )
+    return fig_price, fig_pchange
 
-    # Data Table
-    st.divider()
-    st.subheader("Current Market Snapshot")
-    
+def build_stored_figure(df, store):
+    # None when nothing has been recorded for these symbols yet
+    stored = store.equity_history(index_choice, get_top_gainers(df, 5)['symbol'].tolist(), history_days)
+    if stored.empty:
+        return None
+    import plotly.express as px
+
+    return px.line(
+        stored, x='minute', y='lastPrice', color='symbol',
+        title="Price by Minute (Top 5 Current Gainers)",
+        labels={'minute': 'Time', 'lastPrice': 'Price'}
+    )
+
+def build_snapshot_table(df):
     # Highlight positive/negative changes
     def color_pchange(val):
         color = 'green' if val > 0 else 'red' if val < 0 else 'white'
         return f'color: {color}'
 
     display_df = df[['symbol', 'lastPrice', 'change', 'pChange', 'totalTradedVolume', 'dayHigh', 'dayLow']]
-    st.dataframe(
-        display_df.style.map(color_pchange, subset=['pChange', 'change']),
-        width='stretch',
-        hide_index=True
-    )
+    return display_df.style.map(color_pchange, subset=['pChange', 'change'])
+
+@st.fragment(run_every=refresh_interval)
+def render_market_view():
+    # Only this fragment reruns on the refresh timer; the sidebar and title do not
+    df = load_data()
+
+    if not df.empty:
+        # Top Row Metrics
+        m1, m2, m3, m4 = st.columns(4)
+
+        avg_pchange = df['pChange'].mean()
+        m1.metric("Avg % Change", f"{avg_pchange:.2f}%")
+
+        gainer = get_top_gainers(df, 1).iloc[0]
+        m2.metric("Top Gainer", gainer['symbol'], f"{gainer['pChange']}%")
+
+        loser = get_top_losers(df, 1).iloc[0]
+        m3.metric("Top Loser", loser['symbol'], f"{loser['pChange']}%")
+
+        m4.metric("Last Update", st.session_state.last_update_time)
+
+        # Historical Trends
+        st.divider()
+        st.subheader("Performance Trends")
+
+        if len(st.session_state.history) > 0:
+            fig_price, fig_pchange = get_view_part('trends', lambda: build_trend_figures(df))
+            col_c1, col_c2 = st.columns(2)
+            col_c1.plotly_chart(fig_price, width='stretch')
+            col_c2.plotly_chart(fig_pchange, width='stretch')
+        else:
+            st.info("Collecting historical data points for trends...")
+
+        # Recorded sessions (end-of-minute snapshots on disk)
+        store = get_history_store()
+        if store is not None:
+            # Snapshots are written in the background, so the stored figure is also refreshed once a minute
+            fig_stored = get_view_part('stored', lambda: build_stored_figure(df, store), time.strftime('%H:%M'))
+            if fig_stored is not None:
+                st.divider()
+                st.subheader(f"Stored History (last {history_days} days)")
+                st.plotly_chart(fig_stored, width='stretch')
+
+        # Data Table
+        st.divider()
+        st.subheader("Current Market Snapshot")
+        st.dataframe(get_view_part('snapshot', lambda: build_snapshot_table(df)), width='stretch', hide_index=True)
+
+    else:
+        st.warning("No data available. Market might be closed or NSE is throttling requests.")
+        if st.button("Retry Now"):
+            st.rerun()
 
-else:
-    st.warning("No data available. Market might be closed or NSE is throttling requests.")
-    if st.button("Retry Now"):
-        st.rerun()
+    st.caption(f"Next refresh in {refresh_interval} seconds...")
 
-# Auto-refresh mechanism
-st.caption(f"Next refresh in {refresh_interval} seconds...")
-time.sleep(refresh_interval)
-st.rerun()
+# Auto-refresh is driven by the fragment's timer instead of sleep + full rerun
+render_market_view()
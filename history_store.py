@@ -0,0 +1,346 @@
+"""
+Local analytical store of end-of-minute option chain (and NSE equity) snapshots.
+A snapshot is taken on the first refresh of each minute, i.e. the close of the previous minute.
+
+Layout under the store root (Parquet, partitioned by index/category and date):
+  chains/index=NIFTY/date=2026-10-19/0915_23OCT26.parquet   full chain at the end of each minute
+  equity/category=NIFTY 50/date=2026-10-19.parquet          per-minute equity snapshots for a day
+  rollups/intraday/index=NIFTY/date=2026-10-19.parquet      per-minute spot, ATM IV, PCR
+  rollups/daily/index=NIFTY.parquet                         one row per session (close ATM IV, PCR, ...) of the nearest expiry
+  rollups/oi_close/index=NIFTY.parquet                      session-close OI per expiry and strike
+  rollups/pcr_tod/index=NIFTY.parquet                       PCR distribution per 15-minute bucket
+
+Snapshots are written by a background thread. Rollups are updated as each snapshot is written and
+kept in memory, so the queries below only touch small in-memory frames and return in milliseconds
+regardless of how many sessions are stored.
+The raw snapshots stay available for ad-hoc SQL through DuckDB when it is installed.
+"""
+import os
+import logging
+import queue
+import threading
+import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta
+from analytics import calculate_pcr, years_to_expiry
+import config
+
+PCR_BUCKET_MINUTES = 15
+PCR_BINS = np.linspace(0, 3, 61) # histogram edges for PCR; values above 3 land in the last bin
+
+def _write_parquet(df, path):
+    # Write to a temp file and rename so readers never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+def _read_parquet(path, columns=None):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns)
+    df = pd.read_parquet(path)
+    # Rollups written before a column existed (e.g. expiry) load with it empty
+    for col in columns or []:
+        if col not in df.columns:
+            df[col] = None
+    return df
+
+def _append(existing, rows):
+    # A missing rollup is seeded untyped (object columns); never concatenate onto an empty frame,
+    # so the in-memory rollups keep the same dtypes as the ones loaded from disk
+    if existing.empty:
+        return rows.reset_index(drop=True)
+    return pd.concat([existing, rows], ignore_index=True)
+
+def atm_iv(df, atm_strike):
+    # Mean of the CE/PE IVs at the ATM strike that have been computed (IV columns are in %)
+    if atm_strike not in df.index:
+        return np.nan
+    ivs = [v for v in (df.loc[atm_strike, 'CE_IV'], df.loc[atm_strike, 'PE_IV']) if v > 0]
+    return float(np.mean(ivs)) if ivs else np.nan
+
+class HistoryStore:
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock() # guards _last_minute and the writer start; never held during I/O
+        self._data_lock = threading.RLock() # guards the in-memory rollups shared by the writer and the queries
+        self._last_minute = {} # (index or category, expiry) -> last recorded minute
+        self._intraday = {} # (index, date) -> DataFrame
+        self._daily = {} # index -> DataFrame
+        self._oi_close = {} # index -> DataFrame
+        self._pcr_tod = {} # index -> DataFrame
+        self._equity = {} # (category, date) -> DataFrame; completed days never change once loaded
+        self._queue = queue.Queue()
+        self._writer = None
+
+    # --- paths ---
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _intraday_path(self, index, date):
+        return self._path('rollups', 'intraday', f'index={index}', f'date={date}.parquet')
+
+    def _rollup_path(self, name, index):
+        return self._path('rollups', name, f'index={index}.parquet')
+
+    def _equity_path(self, category, date):
+        return self._path('equity', f'category={category}', f'date={date}.parquet')
+
+    # --- in-memory rollups, loaded from disk on first use ---
+
+    def _get_intraday(self, index, date):
+        key = (index, date)
+        if key not in self._intraday:
+            self._intraday[key] = _read_parquet(self._intraday_path(index, date), ['minute', 'spot', 'atm_strike', 'atm_iv', 'pcr'])
+        return self._intraday[key]
+
+    def _get_daily(self, index):
+        if index not in self._daily:
+            self._daily[index] = _read_parquet(self._rollup_path('daily', index),
+                                               ['date', 'expiry', 'spot_close', 'atm_iv_close', 'atm_iv_high', 'atm_iv_low', 'pcr_close', 'ce_oi', 'pe_oi'])
+        return self._daily[index]
+
+    def _get_oi_close(self, index):
+        if index not in self._oi_close:
+            self._oi_close[index] = _read_parquet(self._rollup_path('oi_close', index), ['date', 'expiry', 'strike', 'CE_OI', 'PE_OI'])
+        return self._oi_close[index]
+
+    def _get_pcr_tod(self, index):
+        if index not in self._pcr_tod:
+            df = _read_parquet(self._rollup_path('pcr_tod', index))
+            if df.empty:
+                n_buckets = 24 * 60 // PCR_BUCKET_MINUTES
+                df = pd.DataFrame({'bucket': np.arange(n_buckets), 'count': 0, 'sum': 0.0, 'sumsq': 0.0,
+                                   'min': np.inf, 'max': -np.inf})
+                for i in range(len(PCR_BINS) - 1):
+                    df[f'h{i}'] = 0
+            self._pcr_tod[index] = df
+        return self._pcr_tod[index]
+
+    def _get_equity(self, category, date):
+        key = (category, date)
+        if key not in self._equity:
+            self._equity[key] = _read_parquet(self._equity_path(category, date))
+        return self._equity[key]
+
+    # --- writes: queued to a background thread so the refresh loop never waits on Parquet I/O ---
+
+    def _submit(self, fn, *args):
+        # Under the lock: sessions recording their first snapshot together must not start two writers
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='history-writer', daemon=True)
+                self._writer.start()
+        self._queue.put((fn, args))
+
+    def _write_loop(self):
+        while True:
+            fn, args = self._queue.get()
+            try:
+                fn(*args)
+            except Exception as e:
+                logging.error(f"Failed to record history snapshot: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        # Blocks until every queued snapshot has been written
+        self._queue.join()
+
+    def maybe_record(self, manager, now=None, rollups=True):
+        # Queues the chain once per minute; safe to call on every refresh and from several sessions.
+        # rollups=False stores the raw snapshot and session-close OI only (e.g. for far expiries)
+        now = now or datetime.now()
+        minute = now.replace(second=0, microsecond=0)
+        key = (manager.index_symbol, manager.expiry)
+        with self._lock:
+            if self._last_minute.get(key) == minute or manager.full_chain.empty:
+                return False
+            self._last_minute[key] = minute
+        # Copy now: the live chain keeps changing while the write is queued
+        self._submit(self._record_chain, manager.index_symbol, manager.expiry, manager.full_chain.copy(),
+                     manager.spot_price, manager.atm_strike, minute, rollups)
+        return True
+
+    def _record_chain(self, index, expiry, df, spot, atm_strike, minute, rollups):
+        date = minute.strftime('%Y-%m-%d')
+
+        snapshot = df.drop(columns=[c for c in df.columns if c.endswith('_token')]).rename_axis('Strike').reset_index()
+        snapshot.insert(0, 'minute', minute)
+        snapshot['spot'] = spot
+        snapshot['expiry'] = expiry
+        _write_parquet(snapshot, self._path('chains', f'index={index}', f'date={date}', f"{minute:%H%M}_{expiry}.parquet"))
+
+        # Rollup frames are rebuilt under the data lock and swapped in; files are written outside it
+        writes = []
+        with self._data_lock:
+            # Session-close OI per expiry and strike, for every tracked expiry so changes can be taken
+            # within one contract across the weekly roll
+            oi = self._get_oi_close(index)
+            oi_rows = pd.DataFrame({'date': date, 'expiry': expiry, 'strike': df.index.values,
+                                    'CE_OI': df['CE_OI'].values, 'PE_OI': df['PE_OI'].values})
+            oi = _append(oi[(oi['date'] != date) | (oi['expiry'] != expiry)], oi_rows)
+            self._oi_close[index] = oi
+            writes.append((oi, self._rollup_path('oi_close', index)))
+
+            if rollups:
+                pcr, total_ce, total_pe = calculate_pcr(df)
+                iv = atm_iv(df, atm_strike)
+
+                # Intraday: one row per minute. A minute already present was recorded by an earlier
+                # process (restart within the minute) and is already counted in pcr_tod
+                intraday = self._get_intraday(index, date)
+                counted = bool((intraday['minute'] == minute).any())
+                row = pd.DataFrame([{'minute': minute, 'spot': spot, 'atm_strike': atm_strike, 'atm_iv': iv, 'pcr': pcr}])
+                intraday = _append(intraday[intraday['minute'] != minute], row)
+                self._intraday[(index, date)] = intraday
+                writes.append((intraday, self._intraday_path(index, date)))
+
+                # Daily: the session's row is replaced every minute, so it holds the close at the end of the day
+                daily = self._get_daily(index)
+                day_row = pd.DataFrame([{
+                    'date': date, 'expiry': expiry, 'spot_close': spot, 'atm_iv_close': iv,
+                    'atm_iv_high': intraday['atm_iv'].max(), 'atm_iv_low': intraday['atm_iv'].min(),
+                    'pcr_close': pcr, 'ce_oi': total_ce, 'pe_oi': total_pe,
+                }])
+                daily = _append(daily[daily['date'] != date], day_row).sort_values('date', ignore_index=True)
+                self._daily[index] = daily
+                writes.append((daily, self._rollup_path('daily', index)))
+
+                # PCR by time of day: running moments and a fixed-bin histogram per bucket
+                if not counted:
+                    tod = self._get_pcr_tod(index).copy()
+                    b = (minute.hour * 60 + minute.minute) // PCR_BUCKET_MINUTES
+                    tod.loc[b, 'count'] += 1
+                    tod.loc[b, 'sum'] += pcr
+                    tod.loc[b, 'sumsq'] += pcr * pcr
+                    tod.loc[b, 'min'] = min(tod.loc[b, 'min'], pcr)
+                    tod.loc[b, 'max'] = max(tod.loc[b, 'max'], pcr)
+                    h = min(max(np.searchsorted(PCR_BINS, pcr, side='right') - 1, 0), len(PCR_BINS) - 2)
+                    tod.loc[b, f'h{h}'] += 1
+                    self._pcr_tod[index] = tod
+                    writes.append((tod, self._rollup_path('pcr_tod', index)))
+
+        for frame, path in writes:
+            _write_parquet(frame, path)
+
+    def record_equity(self, category, df, now=None):
+        # NSE dashboard snapshots: one set of rows per minute per category
+        if df is None or df.empty:
+            return False
+        now = now or datetime.now()
+        minute = now.replace(second=0, microsecond=0)
+        key = (category, None)
+        with self._lock:
+            if self._last_minute.get(key) == minute:
+                return False
+            self._last_minute[key] = minute
+        cols = [c for c in ['symbol', 'lastPrice', 'change', 'pChange', 'totalTradedVolume'] if c in df.columns]
+        rows = df[cols].copy()
+        rows.insert(0, 'minute', minute)
+        self._submit(self._record_equity, category, rows, minute)
+        return True
+
+    def _record_equity(self, category, rows, minute):
+        date = minute.strftime('%Y-%m-%d')
+        with self._data_lock:
+            existing = self._get_equity(category, date)
+            if not existing.empty:
+                rows = pd.concat([existing[existing['minute'] != minute], rows], ignore_index=True)
+            self._equity[(category, date)] = rows
+        _write_parquet(rows, self._equity_path(category, date))
+
+    # --- queries ---
+
+    def atm_iv_percentile(self, index, lookback_days=252, current=None):
+        # Percentile of the current ATM IV against session-close ATM IVs over the lookback
+        with self._data_lock:
+            daily = self._get_daily(index)
+        closes = daily['atm_iv_close'].dropna().to_numpy(dtype=float)[-lookback_days:]
+        if current is None:
+            current = closes[-1] if len(closes) else np.nan
+        if len(closes) == 0 or np.isnan(current):
+            return {'current': current, 'percentile': np.nan, 'rank': np.nan, 'sessions': len(closes)}
+        lo, hi = closes.min(), closes.max()
+        return {
+            'current': float(current),
+            'percentile': float((closes < current).mean() * 100),
+            'rank': float((current - lo) / (hi - lo) * 100) if hi > lo else 50.0,
+            'sessions': int(len(closes)),
+        }
+
+    def oi_change_by_strike(self, index, sessions=5, expiry=None):
+        # OI change per strike of one expiry between its latest session close and the close `sessions`
+        # sessions earlier (or its first recorded session); expiry=None uses the nearest in the latest session
+        with self._data_lock:
+            oi = self._get_oi_close(index)
+        if expiry is None and not oi.empty:
+            expiry = min(oi.loc[oi['date'] == oi['date'].max(), 'expiry'].unique(), key=years_to_expiry)
+        oi = oi[oi['expiry'] == expiry]
+        if oi.empty:
+            return pd.DataFrame(columns=['CE_OI_CHG', 'PE_OI_CHG'])
+        dates = sorted(oi['date'].unique())
+        latest, base = dates[-1], dates[max(0, len(dates) - 1 - sessions)]
+        now = oi[oi['date'] == latest].set_index('strike')[['CE_OI', 'PE_OI']]
+        then = oi[oi['date'] == base].set_index('strike')[['CE_OI', 'PE_OI']]
+        chg = now.sub(then.reindex(now.index).fillna(0))
+        chg.columns = ['CE_OI_CHG', 'PE_OI_CHG']
+        chg.index.name = 'Strike'
+        chg.attrs['from'], chg.attrs['to'], chg.attrs['expiry'] = base, latest, expiry
+        return chg
+
+    def pcr_by_time_of_day(self, index):
+        # Mean/std/min/max and histogram percentiles of PCR per 15-minute bucket
+        with self._data_lock:
+            tod = self._get_pcr_tod(index)
+        tod = tod[tod['count'] > 0]
+        hist_cols = [f'h{i}' for i in range(len(PCR_BINS) - 1)]
+        if tod.empty:
+            return pd.DataFrame(columns=['time', 'count', 'mean', 'std', 'min', 'max', 'p10', 'p50', 'p90'])
+        counts = tod['count'].to_numpy(dtype=float)
+        mean = tod['sum'].to_numpy() / counts
+        std = np.sqrt(np.maximum(tod['sumsq'].to_numpy() / counts - mean ** 2, 0))
+        cdf = np.cumsum(tod[hist_cols].to_numpy(dtype=float), axis=1) / counts[:, None]
+        upper_edges = PCR_BINS[1:]
+        result = pd.DataFrame({
+            'time': [f"{b * PCR_BUCKET_MINUTES // 60:02d}:{b * PCR_BUCKET_MINUTES % 60:02d}" for b in tod['bucket']],
+            'count': tod['count'].to_numpy(),
+            'mean': mean, 'std': std, 'min': tod['min'].to_numpy(), 'max': tod['max'].to_numpy(),
+        })
+        for q in (10, 50, 90):
+            result[f'p{q}'] = upper_edges[np.argmax(cdf >= q / 100, axis=1)]
+        return result
+
+    def intraday(self, index, date=None):
+        with self._data_lock:
+            return self._get_intraday(index, date or datetime.now().strftime('%Y-%m-%d'))
+
+    def equity_history(self, category, symbols=None, days=5):
+        # Per-minute equity rows for the last `days` calendar days. Each day is read from disk once and
+        # kept in memory; today's frame is maintained by the writer, so refreshes do no Parquet reads
+        today = datetime.now().date()
+        dates = [(today - timedelta(days=d)).strftime('%Y-%m-%d') for d in range(days, -1, -1)]
+        with self._data_lock:
+            frames = [self._get_equity(category, date) for date in dates]
+        frames = [f[f['symbol'].isin(symbols)] if symbols is not None else f for f in frames if not f.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def sql(self, query):
+        # Ad-hoc SQL over the raw snapshots, e.g.
+        #   SELECT minute, Strike, CE_IV FROM chains WHERE "index" = 'NIFTY'
+        # duckdb is optional and imported here so it never adds to app startup
+        try:
+            import duckdb
+        except ImportError:
+            raise RuntimeError("duckdb is not installed")
+        con = duckdb.connect()
+        chains = self._path('chains', '*', '*', '*.parquet')
+        con.execute(f"CREATE VIEW chains AS SELECT * FROM read_parquet('{chains}', hive_partitioning = true)")
+        return con.execute(query).df()
+
+def open_store(root=None):
+    # The store under HISTORY_DIR, or None when recording is disabled. Apps should keep one per process
+    # (e.g. st.cache_resource) so each snapshot is recorded once per minute across sessions
+    root = config.HISTORY_DIR if root is None else root
+    return HistoryStore(root) if root else None
@@ -1,13 +1,34 @@
-import time
 import pandas as pd
-import random
+import numpy as np
 import logging
+import threading
 from datetime import datetime, timedelta
 
-try:
-    from neo_api_client import NeoAPI
-except ImportError:
-    NeoAPI = None
+def _load_neo_api():
+    # The SDK is only needed for a live login, so it is imported on demand
+    try:
+        from neo_api_client import NeoAPI
+        return NeoAPI
+    except ImportError:
+        return None
+
+_simulator = None
+_simulator_lock = threading.Lock()
+
+def get_demo_simulator(config, instruments):
+    # One simulator per process, like the LiveDataManager it feeds: every session's client subscribes
+    # to the same market, so all of them see a single consistent price path
+    global _simulator
+    with _simulator_lock:
+        if _simulator is None:
+            from simulator import MarketSimulator
+            from live_data import LiveDataManager
+            _simulator = MarketSimulator(instruments, config.DEMO_SPOT_PRICES)
+            _simulator.start(LiveDataManager().update_ticks, rate=config.DEMO_TICK_RATE, interval=config.DEMO_BATCH_INTERVAL)
+        else:
+            # Built from the first session's instrument master: later sessions may bring newer expiries
+            _simulator.add_contracts(instruments)
+        return _simulator
 
 class KotakNeoClient:
     def __init__(self, config):
@@ -15,6 +36,7 @@ class KotakNeoClient:
         self.client = None
         self.is_logged_in = False
         self.instruments = pd.DataFrame()
+        self.simulator = None
         
     def login(self, mobile_number=None, mpin=None, api_key=None, api_secret=None, ucc=None, totp=None):
         if self.config.DEMO_MODE:
@@ -22,6 +44,7 @@ class KotakNeoClient:
             self.is_logged_in = True
             return True, "Success (Demo Mode)"
         
+        NeoAPI = _load_neo_api()
         if NeoAPI is None:
             return False, "NeoAPI client not installed."
         
@@ -49,7 +72,8 @@ class KotakNeoClient:
 
     def get_instruments(self):
         if self.config.DEMO_MODE:
-            return self._generate_mock_instruments()
+            self.instruments = self._generate_mock_instruments()
+            return self.instruments
         
         try:
             # Fetch instrument master for NFO
@@ -58,76 +82,79 @@ class KotakNeoClient:
             # We'll assume it returns a path or we read it from the default location.
             # For brevity, let's assume we can load it.
             df = pd.read_csv("nfo_scrip.csv")
+            self.instruments = df
             return df
         except Exception as e:
             logging.error(f"Failed to fetch instruments: {e}")
             return pd.DataFrame()
 
+    def get_positions(self):
+        # Returns a list of {symbol, strike, option_type, expiry, token, qty, avg_price}
+        if self.config.DEMO_MODE:
+            from portfolio import load_positions_file
+            return load_positions_file(self.config.POSITIONS_FILE)
+
+        try:
+            response = self.client.positions()
+            positions = []
+            for p in response.get('data', []):
+                qty = int(p.get('flBuyQty', 0)) + int(p.get('cfBuyQty', 0)) - int(p.get('flSellQty', 0)) - int(p.get('cfSellQty', 0))
+                if qty == 0 or p.get('optTp') not in ('CE', 'PE'):
+                    continue
+                buy_amt = float(p.get('buyAmt', 0)) + float(p.get('cfBuyAmt', 0))
+                sell_amt = float(p.get('sellAmt', 0)) + float(p.get('cfSellAmt', 0))
+                positions.append({
+                    "symbol": p.get('sym'),
+                    "strike": float(p.get('stkPrc', 0)),
+                    "option_type": p.get('optTp'),
+                    "expiry": p.get('expDt'),
+                    "token": p.get('tok'),
+                    "qty": qty,
+                    "avg_price": (buy_amt - sell_amt) / qty
+                })
+            return positions
+        except Exception as e:
+            logging.error(f"Failed to fetch positions: {e}")
+            return []
+
     def _generate_mock_instruments(self):
-        # Generate some mock NIFTY/BANKNIFTY option instruments
-        data = []
-        indices = ["NIFTY", "BANKNIFTY"]
-        spot_prices = {"NIFTY": 22000, "BANKNIFTY": 47000}
-        
-        # Current Thursday or next Thursday for expiry
+        # Generate mock option instruments for every index over DEMO_EXPIRIES weekly expiries
+        # and DEMO_STRIKES strikes on each side of ATM
+        n_expiries = self.config.DEMO_EXPIRIES
+        n_strikes = self.config.DEMO_STRIKES
+
+        # Current Thursday (until its 15:30 close) or next Thursday for the first expiry, then weekly
         today = datetime.now()
         days_until_thursday = (3 - today.weekday()) % 7
-        expiry = (today + timedelta(days=days_until_thursday)).strftime("%d%b%y").upper()
-        
-        for index in indices:
-            spot = spot_prices[index]
-            step = 50 if index == "NIFTY" else 100
-            # Generate 10 strikes above and below ATM
+        if days_until_thursday == 0 and (today.hour, today.minute) >= (15, 30):
+            days_until_thursday = 7
+        expiries = [(today + timedelta(days=days_until_thursday + 7 * w)).strftime("%d%b%y").upper() for w in range(n_expiries)]
+
+        frames = []
+        for index in self.config.INDICES:
+            spot = self.config.DEMO_SPOT_PRICES[index]
+            step = self.config.STRIKE_STEPS.get(index, 100)
             atm = round(spot / step) * step
-            for i in range(-10, 11):
-                strike = atm + (i * step)
-                for option_type in ["CE", "PE"]:
-                    data.append({
-                        "trading_symbol": f"{index}{expiry}{strike}{option_type}",
-                        "symbol": index,
-                        "strike_price": float(strike),
-                        "option_type": option_type,
-                        "expiry": expiry,
-                        "instrument_token": f"{index}_{strike}_{option_type}",
-                        "lot_size": 50 if index == "NIFTY" else 15
-                    })
-        return pd.DataFrame(data)
+            strikes = atm + np.arange(-n_strikes, n_strikes + 1) * step
+            # Cartesian product expiry x strike x type
+            df = pd.MultiIndex.from_product([expiries, strikes.astype(float), ["CE", "PE"]],
+                                            names=["expiry", "strike_price", "option_type"]).to_frame(index=False)
+            strike_str = df['strike_price'].astype(int).astype(str)
+            df['trading_symbol'] = index + df['expiry'] + strike_str + df['option_type']
+            df['symbol'] = index
+            df['instrument_token'] = index + "_" + df['expiry'] + "_" + strike_str + "_" + df['option_type']
+            df['lot_size'] = self.config.LOT_SIZES.get(index, 1)
+            frames.append(df[["trading_symbol", "symbol", "strike_price", "option_type", "expiry", "instrument_token", "lot_size"]])
+        return pd.concat(frames, ignore_index=True)
 
     def subscribe_quotes(self, tokens, callback):
-        from live_data import LiveDataManager
-        ldm = LiveDataManager()
-        
         if self.config.DEMO_MODE:
-            if not hasattr(self, 'subscribed_tokens'):
-                self.subscribed_tokens = set()
-            
-            self.subscribed_tokens.update(tokens)
-
-            # In demo mode, we'll start a background simulator
-            import threading
-            def simulate():
-                while True:
-                    # Use a copy of tokens to avoid runtime error during iteration
-                    current_tokens = list(self.subscribed_tokens)
-                    for token in current_tokens:
-                        # Randomize some values
-                        price = 100 + random.uniform(-5, 5)
-                        oi = 100000 + random.randint(-5000, 5000)
-                        msg = {
-                            "token": token,
-                            "lp": price,
-                            "oi": oi,
-                            "v": random.randint(1000, 5000),
-                            "bp": price - 0.5,
-                            "ap": price + 0.5
-                        }
-                        ldm.update_tick(token, msg)
-                    time.sleep(1)
-            
-            if not hasattr(self, '_simulator_started'):
-                thread = threading.Thread(target=simulate, daemon=True)
-                thread.start()
-                self._simulator_started = True
+            # In demo mode, the process-wide simulator streams batched ticks into the LiveDataManager;
+            # a session only adds its tokens to it
+            if self.simulator is None:
+                instruments = self.instruments if not self.instruments.empty else self._generate_mock_instruments()
+                self.simulator = get_demo_simulator(self.config, instruments)
+            self.simulator.subscribe(tokens)
             return
         
         # Real implementation:
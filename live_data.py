@@ -1,19 +1,49 @@
+import time
 import threading
+from metrics import counter, gauge, rate, histogram
+
+TICKS = counter('feed_ticks_total', 'Ticks received from the feed')
+TICK_RATE = rate('feed_tick_rate', 'Ticks/sec received from the feed')
+FEED_LAG = histogram('feed_lag_seconds', 'Delay between tick timestamp and ingest (sampled once per batch)')
+PENDING = gauge('feed_pending_ticks', 'Ticks received since the last sync (conflated per token on read)')
+SYNC_BATCH = gauge('feed_sync_tokens', 'Tokens returned by the last sync')
 
 class LiveDataManager:
     _instance = None
     _lock = threading.Lock()
-    
+
     def __new__(cls):
         with cls._lock:
             if cls._instance is None:
                 cls._instance = super(LiveDataManager, cls).__new__(cls)
                 cls._instance.data = {}
+                # Monotonic data version, bumped on every tick
+                cls._instance.version = 0
+                cls._instance.token_versions = {} # token -> version of its last tick
         return cls._instance
 
     def update_tick(self, token, tick):
         with self._lock:
+            self.version += 1
             self.data[token] = tick
+            self.token_versions[token] = self.version
+        TICKS.inc()
+        TICK_RATE.mark()
+        if 'ts' in tick:
+            FEED_LAG.observe(time.time() - tick['ts'])
+
+    def update_ticks(self, ticks):
+        # Batched ingest: one lock acquisition for the whole batch
+        with self._lock:
+            for tick in ticks:
+                self.version += 1
+                token = tick['token']
+                self.data[token] = tick
+                self.token_versions[token] = self.version
+        TICKS.inc(len(ticks))
+        TICK_RATE.mark(len(ticks))
+        if ticks and 'ts' in ticks[0]:
+            FEED_LAG.observe(time.time() - ticks[0]['ts'])
 
     def get_tick(self, token):
         with self._lock:
@@ -22,3 +52,17 @@ class LiveDataManager:
     def get_all_ticks(self):
         with self._lock:
             return self.data.copy()
+
+    def get_version(self):
+        return self.version
+
+    def get_updates_since(self, version):
+        # Returns (current_version, {token: tick}) for tokens that ticked after `version`
+        with self._lock:
+            PENDING.set(max(self.version - version, 0))
+            if version >= self.version:
+                SYNC_BATCH.set(0)
+                return self.version, {}
+            updates = {token: self.data[token] for token, v in self.token_versions.items() if v > version}
+            SYNC_BATCH.set(len(updates))
+            return self.version, updates
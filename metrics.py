@@ -0,0 +1,287 @@
+"""
+Low-overhead in-process metrics for the hot path.
+- Counters, gauges, rate meters and fixed-bucket histograms, optionally labelled.
+- timed(name) works as a decorator or a context manager and records seconds into a histogram.
+- render_prometheus() returns the Prometheus text format; start_metrics_server() serves it on /metrics.
+"""
+import time
+import bisect
+import logging
+import threading
+import numpy as np
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+
+# Seconds, from 10us to 5s
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+def _label_str(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+class _Metric:
+    # Recorders return early when the owning registry is disabled
+    def __init__(self, registry=None):
+        self.registry = registry
+
+    @property
+    def enabled(self):
+        return self.registry is None or self.registry.enabled
+
+class Counter(_Metric):
+    # Name counters with a _total suffix, as Prometheus expects
+    kind = 'counter'
+
+    def __init__(self, registry=None):
+        super().__init__(registry)
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.value += n
+
+    def samples(self, name, labels):
+        return [(name + _label_str(labels), self.value)]
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, registry=None):
+        super().__init__(registry)
+        self.value = 0.0
+
+    def set(self, value):
+        if self.enabled:
+            self.value = value
+
+    def samples(self, name, labels):
+        return [(name + _label_str(labels), self.value)]
+
+class RateMeter(_Metric):
+    # Events/sec over the last window, computed on read
+    kind = 'gauge'
+
+    def __init__(self, registry=None, window=1.0):
+        super().__init__(registry)
+        self.window = window
+        self.count = 0
+        self._lock = threading.Lock()
+        self._last_count = 0
+        self._last_time = time.perf_counter()
+        self._rate = 0.0
+
+    def mark(self, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.count += n
+
+    @property
+    def value(self):
+        now = time.perf_counter()
+        with self._lock:
+            elapsed = now - self._last_time
+            if elapsed >= self.window:
+                self._rate = (self.count - self._last_count) / elapsed
+                self._last_count, self._last_time = self.count, now
+            return self._rate
+
+    def samples(self, name, labels):
+        return [(name + _label_str(labels), self.value)]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry=None, buckets=LATENCY_BUCKETS):
+        super().__init__(registry)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        if not self.enabled:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def observe_many(self, values):
+        # Vectorized: one searchsorted/bincount for the whole array instead of a bisect per value
+        if not self.enabled:
+            return
+        values = np.asarray(values, dtype=float).ravel()
+        if not len(values):
+            return
+        self.add_counts(np.bincount(np.searchsorted(self.buckets, values), minlength=len(self.counts)), values.sum())
+
+    def add_counts(self, counts, total):
+        # Merge per-bucket counts (e.g. from a worker process) into this histogram
+        if not self.enabled:
+            return
+        with self._lock:
+            for i, c in enumerate(counts):
+                self.counts[i] += int(c)
+            self.sum += float(total)
+            self.count += int(sum(counts))
+
+    def quantile(self, q):
+        # Upper bound of the bucket containing the q-th observation
+        if self.count == 0:
+            return 0.0
+        target, running = q * self.count, 0
+        for bound, c in zip(self.buckets, self.counts):
+            running += c
+            if running >= target:
+                return bound
+        return float('inf')
+
+    @property
+    def value(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def samples(self, name, labels):
+        out, running = [], 0
+        for bound, c in zip(self.buckets, self.counts):
+            running += c
+            out.append((name + '_bucket' + _label_str(labels, {'le': bound}), running))
+        out.append((name + '_bucket' + _label_str(labels, {'le': '+Inf'}), self.count))
+        out.append((name + '_sum' + _label_str(labels), self.sum))
+        out.append((name + '_count' + _label_str(labels), self.count))
+        return out
+
+class _Timed:
+    def __init__(self, registry, histogram):
+        self.registry = registry
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.registry.enabled:
+            self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+    def __call__(self, fn):
+        registry, histogram = self.registry, self.histogram
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+
+class MetricsRegistry:
+    def __init__(self, prefix='kotak_dashboard', enabled=True):
+        self.prefix = prefix
+        self.enabled = enabled
+        self._metrics = {} # (name, labels) -> metric
+        self._help = {} # name -> (kind, help)
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = cls(self, **kwargs)
+                    self._metrics[key] = metric
+                    self._help.setdefault(name, (metric.kind, help))
+        return metric
+
+    def counter(self, name, help='', labels=None):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help='', labels=None):
+        return self._get(Gauge, name, help, labels)
+
+    def rate(self, name, help='', labels=None, window=1.0):
+        return self._get(RateMeter, name, help, labels, window=window)
+
+    def histogram(self, name, help='', labels=None, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def timed(self, name, help='', labels=None):
+        return _Timed(self, self.histogram(name, help, labels))
+
+    def render_prometheus(self):
+        lines, seen = [], set()
+        for (name, labels), metric in sorted(self._metrics.items(), key=lambda kv: kv[0]):
+            full = f'{self.prefix}_{name}'
+            if name not in seen:
+                kind, help = self._help[name]
+                if help:
+                    lines.append(f'# HELP {full} {help}')
+                lines.append(f'# TYPE {full} {kind}')
+                seen.add(name)
+            lines.extend(f'{sample} {value}' for sample, value in metric.samples(full, labels))
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        # Flat rows for the debug panel
+        rows = []
+        for (name, labels), metric in sorted(self._metrics.items(), key=lambda kv: kv[0]):
+            row = {'metric': name + _label_str(labels), 'type': metric.kind, 'value': metric.value}
+            if isinstance(metric, Histogram):
+                row.update({'count': metric.count, 'p50': metric.quantile(0.5), 'p99': metric.quantile(0.99)})
+            rows.append(row)
+        return rows
+
+REGISTRY = MetricsRegistry(enabled=config.METRICS_ENABLED)
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+rate = REGISTRY.rate
+histogram = REGISTRY.histogram
+timed = REGISTRY.timed
+
+_server = None
+
+def start_metrics_server(port=None, host='127.0.0.1'):
+    # Serves /metrics in a daemon thread; safe to call on every Streamlit rerun
+    global _server
+    port = config.METRICS_PORT if port is None else port
+    if _server is not None or not port:
+        return _server or None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = REGISTRY.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        _server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        logging.error(f"Metrics server could not bind {host}:{port}: {e}")
+        _server = False # don't retry on every rerun
+        return None
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    logging.info(f"Metrics served on http://{host}:{port}/metrics")
+    return _server
@@ -1,6 +1,17 @@
+import logging
 import pandas as pd
 import numpy as np
-from analytics import black_scholes, find_iv
+from analytics import chain_greeks, years_to_expiry, is_expired
+import config
+from metrics import timed
+
+def list_expiries(instruments_df, index_symbol, now=None):
+    # Unexpired expiries of an index, nearest first. A master fetched after the 15:30 close still lists
+    # that day's contracts, which would otherwise sort first with no time left
+    df = instruments_df[instruments_df['symbol'] == index_symbol]
+    if 'expiry' not in df.columns:
+        return []
+    return sorted((e for e in df['expiry'].unique() if not is_expired(e, now)), key=years_to_expiry)
 
 class OptionChainManager:
     def __init__(self, index_symbol):
@@ -8,19 +19,28 @@ class OptionChainManager:
         self.full_chain = pd.DataFrame()
         self.spot_price = 0.0
         self.atm_strike = 0.0
+        self.expiry = None
         self.token_map = {} # token -> (strike, type)
+        self.version = 0 # bumped whenever a tick changes the chain
         
-    def initialize_chain(self, instruments_df, spot_price):
+    def initialize_chain(self, instruments_df, spot_price, expiry=None):
         self.spot_price = spot_price
-        # Filter for the selected index
-        df = instruments_df[instruments_df['symbol'] == self.index_symbol].copy()
-        
+        # Filter for the selected index and expiry (nearest expiry by default)
+        df = instruments_df[instruments_df['symbol'] == self.index_symbol]
+        if expiry is None and 'expiry' in df.columns and not df.empty:
+            expiries = list_expiries(df, self.index_symbol)
+            if expiries:
+                expiry = expiries[0]
+            else:
+                # Only expired contracts listed: leave the chain empty rather than mix expiries
+                logging.warning(f"No unexpired contracts for {self.index_symbol} in the instrument master")
+                df = df.iloc[0:0]
+        if expiry is not None:
+            df = df[df['expiry'] == expiry]
+        self.expiry = expiry
+
         # Calculate ATM
-        if self.index_symbol == "NIFTY":
-            step = 50
-        else:
-            step = 100
-        self.atm_strike = round(self.spot_price / step) * step
+        self.atm_strike = self._atm_strike(self.spot_price)
         
         # Structure the chain
         # Columns: Strike, CE_LTP, CE_OI, CE_CHG_OI, CE_VOL, PE_LTP, PE_OI, PE_CHG_OI, PE_VOL
@@ -29,12 +49,10 @@ class OptionChainManager:
         self.full_chain.index.name = 'Strike'
         
         # Add metadata like tokens
-        for _, row in df.iterrows():
-            strike = row['strike_price']
-            otype = row['option_type']
-            token = row['instrument_token']
-            self.full_chain.loc[strike, f'{otype}_token'] = token
-            self.token_map[token] = (strike, otype)
+        tokens = df.drop_duplicates(['strike_price', 'option_type']).set_index(['strike_price', 'option_type'])['instrument_token'].unstack()
+        for otype in ['CE', 'PE']:
+            self.full_chain[f'{otype}_token'] = tokens[otype] if otype in tokens.columns else None
+        self.token_map = dict(zip(df['instrument_token'], zip(df['strike_price'], df['option_type'])))
             
         # Initialize values
         cols = ['CE_LTP', 'CE_OI', 'CE_CHG_OI', 'CE_VOL', 'CE_BP', 'CE_AP', 'CE_IV', 'CE_Delta',
@@ -44,8 +62,21 @@ class OptionChainManager:
             
         return self.full_chain
 
+    def _atm_strike(self, spot):
+        step = config.STRIKE_STEPS.get(self.index_symbol, 100)
+        return round(spot / step) * step
+
+    @timed('option_chain_update_tick_seconds', 'OptionChainManager.update_tick latency')
     def update_tick(self, tick):
         token = tick.get('token')
+        if token == self.index_symbol:
+            # Underlying tick: move spot and ATM
+            spot = tick.get('lp', 0)
+            if spot > 0 and spot != self.spot_price:
+                self.spot_price = spot
+                self.atm_strike = self._atm_strike(spot)
+                self.version += 1
+            return
         if token in self.token_map:
             strike, otype = self.token_map[token]
             try:
@@ -67,22 +98,36 @@ class OptionChainManager:
                     self.full_chain.loc[strike, f'{otype}_VOL'] = tick.get('v', 0)
                     self.full_chain.loc[strike, f'{otype}_BP'] = tick.get('bp', 0)
                     self.full_chain.loc[strike, f'{otype}_AP'] = tick.get('ap', 0)
+                    self.version += 1
             except Exception:
                 pass
 
+    def time_to_expiry(self, t_days=None):
+        # Years to expiry: t_days if given, else from the chain's expiry date
+        if t_days:
+            return max(t_days / 365.0, 0.0001)
+        return years_to_expiry(self.expiry)
+
+    def greeks_inputs(self):
+        # Arrays the Greeks computation needs, in chain row order
+        return (self.full_chain.index.values.astype(float),
+                self.full_chain['CE_LTP'].values.astype(float),
+                self.full_chain['PE_LTP'].values.astype(float))
+
+    @timed('option_chain_calculate_greeks_seconds', 'OptionChainManager.calculate_greeks latency')
     def calculate_greeks(self, r=0.07, t_days=7):
-        T = max(t_days / 365.0, 0.0001)
-        for strike in self.full_chain.index:
-            for otype in ['CE', 'PE']:
-                ltp = self.full_chain.loc[strike, f'{otype}_LTP']
-                if ltp > 0:
-                    try:
-                        iv = find_iv(ltp, self.spot_price, strike, T, r, otype)
-                        _, delta, gamma, vega, theta = black_scholes(self.spot_price, strike, T, r, iv, otype)
-                        self.full_chain.loc[strike, f'{otype}_IV'] = round(iv * 100, 2)
-                        self.full_chain.loc[strike, f'{otype}_Delta'] = round(delta, 3)
-                    except Exception:
-                        pass
+        strikes, ce_ltp, pe_ltp = self.greeks_inputs()
+        if len(strikes) == 0:
+            return
+        self.apply_greeks(*chain_greeks(self.spot_price, strikes, ce_ltp, pe_ltp, self.time_to_expiry(t_days), r))
+
+    def apply_greeks(self, ce_iv, ce_delta, pe_iv, pe_delta):
+        # Merge computed IV/Delta into the chain; rows without an LTP keep their previous values
+        for otype, iv, delta in (('CE', ce_iv, ce_delta), ('PE', pe_iv, pe_delta)):
+            ok = np.isfinite(iv) & np.isfinite(delta)
+            self.full_chain.loc[ok, f'{otype}_IV'] = np.round(iv[ok] * 100, 2)
+            self.full_chain.loc[ok, f'{otype}_Delta'] = np.round(delta[ok], 3)
+        self.version += 1
 
     def get_display_chain(self, range_strikes=10):
         # Return ATM +/- range_strikes
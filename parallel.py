@@ -0,0 +1,154 @@
+"""
+Process-pool execution of per-chain analytics.
+Chains are packed into one shared-memory block; workers receive only the block name and
+their row range, compute in place, and the results are merged back into the managers.
+"""
+import os
+import math
+import logging
+import threading
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from analytics import chain_greeks, IV_ITERATIONS, IV_FAILURES
+
+# Rows of the shared block: inputs first, then outputs written by the workers
+STRIKE, CE_LTP, PE_LTP, CE_IV, CE_DELTA, PE_IV, PE_DELTA = range(7)
+N_FIELDS = 7
+
+def _attach(name):
+    # Attach without tracking where supported (3.13+). Before that, spawned workers share the parent's
+    # resource tracker, whose registry is a set: the worker's register is a no-op, the parent's unlink()
+    # balances it, and the tracker still cleans the block up if the server dies. Unregistering here
+    # would drop the parent's registration instead.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _greeks_shard(shm_name, capacity, start, stop, spot, T, r):
+    # Returns the IV solver metrics recorded by this shard so the parent can merge them into its registry
+    counts, total, failures = list(IV_ITERATIONS.counts), IV_ITERATIONS.sum, IV_FAILURES.value
+    shm = _attach(shm_name)
+    try:
+        block = np.ndarray((N_FIELDS, capacity), dtype=np.float64, buffer=shm.buf)
+        rows = slice(start, stop)
+        ce_iv, ce_delta, pe_iv, pe_delta = chain_greeks(spot, block[STRIKE, rows], block[CE_LTP, rows], block[PE_LTP, rows], T, r)
+        block[CE_IV, rows] = ce_iv
+        block[CE_DELTA, rows] = ce_delta
+        block[PE_IV, rows] = pe_iv
+        block[PE_DELTA, rows] = pe_delta
+        del block
+    finally:
+        shm.close()
+    counts = [after - before for after, before in zip(IV_ITERATIONS.counts, counts)]
+    return counts, IV_ITERATIONS.sum - total, IV_FAILURES.value - failures
+
+class ParallelAnalytics:
+    def __init__(self, max_workers=None, min_rows=2000):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # Below this many chain rows in total the pool overhead outweighs the gain, so run in-process
+        self.min_rows = min_rows
+        self._executor = None
+        self._shm = None
+        self._capacity = 0
+        self._lock = threading.Lock() # one shared block, so concurrent callers take turns
+        self._executor_lock = threading.Lock() # the pool is also fetched by scenario runs outside _lock
+
+    def _block(self, rows):
+        # Reuse one shared block across refreshes; grow it only when the chains grow
+        if self._shm is None or rows > self._capacity:
+            self._release()
+            self._capacity = max(rows, 1)
+            self._shm = shared_memory.SharedMemory(create=True, size=N_FIELDS * self._capacity * 8)
+        return np.ndarray((N_FIELDS, self._capacity), dtype=np.float64, buffer=self._shm.buf)
+
+    def calculate_greeks(self, managers, r=0.07, t_days=None):
+        # managers: OptionChainManagers, one per (index, expiry); t_days=None uses each chain's expiry
+        with self._lock:
+            self._calculate_greeks(managers, r, t_days)
+
+    def _calculate_greeks(self, managers, r, t_days):
+        managers = [m for m in managers if not m.full_chain.empty]
+        total = sum(len(m.full_chain) for m in managers)
+        if total == 0:
+            return
+        if total < self.min_rows or self.max_workers == 1:
+            for manager in managers:
+                manager.calculate_greeks(r=r, t_days=t_days)
+            return
+
+        block = self._block(total)
+        # Pack every chain into the block and cut it into shards of at most chunk rows,
+        # so one large chain is still spread over several workers
+        chunk = math.ceil(total / self.max_workers)
+        shards, offsets, offset = [], [], 0
+        for manager in managers:
+            strikes, ce_ltp, pe_ltp = manager.greeks_inputs()
+            n = len(strikes)
+            block[STRIKE, offset:offset + n] = strikes
+            block[CE_LTP, offset:offset + n] = ce_ltp
+            block[PE_LTP, offset:offset + n] = pe_ltp
+            T = manager.time_to_expiry(t_days)
+            for start in range(offset, offset + n, chunk):
+                shards.append((start, min(start + chunk, offset + n), manager.spot_price, T))
+            offsets.append((manager, offset, n))
+            offset += n
+
+        executor = self.get_executor()
+        try:
+            futures = [executor.submit(_greeks_shard, self._shm.name, self._capacity, start, stop, spot, T, r)
+                       for start, stop, spot, T in shards]
+            results = [f.result() for f in futures]
+        except (BrokenProcessPool, RuntimeError) as e:
+            # A worker died (OOM kill, segfault), or another caller just discarded this pool: compute this
+            # refresh in-process; a broken pool is dropped so the next refresh starts a fresh one
+            logging.error(f"Analytics process pool unavailable ({e!r}), computing Greeks in-process")
+            if isinstance(e, BrokenProcessPool):
+                self.discard_executor(executor)
+            del block
+            for manager in managers:
+                manager.calculate_greeks(r=r, t_days=t_days)
+            return
+        for counts, total, failures in results:
+            IV_ITERATIONS.add_counts(counts, total)
+            IV_FAILURES.inc(failures)
+
+        # Merge back: copies out of the shared block so the managers never hold views into it
+        for manager, offset, n in offsets:
+            rows = slice(offset, offset + n)
+            manager.apply_greeks(block[CE_IV, rows].copy(), block[CE_DELTA, rows].copy(),
+                                 block[PE_IV, rows].copy(), block[PE_DELTA, rows].copy())
+        del block
+
+    def get_executor(self):
+        # The process pool, created on first use; also shared with the scenario engine
+        with self._executor_lock:
+            if self._executor is None:
+                # spawn: forking the threaded Streamlit server is unsafe; workers are long-lived so startup is paid once
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def discard_executor(self, executor):
+        # Drop a broken pool; a no-op if another caller has already replaced it
+        with self._executor_lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        executor.shutdown(wait=False)
+
+    def _release(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+            self._capacity = 0
+
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self._release()
@@ -0,0 +1,198 @@
+import json
+import time
+import logging
+import pandas as pd
+import numpy as np
+from analytics import black_scholes_vec, find_iv, years_to_expiry
+
+GREEK_COLS = ['Delta', 'Gamma', 'Vega', 'Theta']
+SECONDS_PER_YEAR = 365 * 86400
+# Display units: vega per vol point and theta per day (the model gives per 1.00 of vol and per year)
+GREEK_SCALE = np.array([1.0, 1.0, 1 / 100, 1 / 365])
+
+def load_positions_file(path):
+    # Demo-mode positions: a JSON list of {symbol, strike, option_type, expiry, qty, avg_price[, token]}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logging.info(f"No positions file at {path}")
+        return []
+    except Exception as e:
+        logging.error(f"Failed to read positions from {path}: {e}")
+        return []
+
+class PortfolioManager:
+    def __init__(self, r=0.07, default_days=7):
+        self.r = r
+        self.default_days = default_days
+        self.positions = []
+        self.token_legs = {} # token -> array of leg indices
+        self.index_legs = {} # index symbol -> array of leg indices
+        self.version = 0
+        self._allocate(0)
+
+    def _allocate(self, n):
+        self.symbols = np.empty(n, dtype=object)
+        self.expiries = np.empty(n, dtype=object)
+        self.tokens = np.empty(n, dtype=object)
+        self.rows = np.full(n, -1, dtype=int) # row of the leg's strike in its chain
+        self.strikes = np.zeros(n)
+        self.is_call = np.zeros(n, dtype=bool)
+        self.qty = np.zeros(n)
+        self.avg_price = np.zeros(n)
+        self.expiry_ts = np.zeros(n) # epoch seconds at expiry; time to expiry is taken from it on every revalue
+        self.t_years = np.zeros(n)
+        self.spot = np.zeros(n)
+        self.ltp = np.zeros(n)
+        self.iv = np.full(n, 0.2)
+        # Per-leg contributions and their running totals
+        self.leg_greeks = np.zeros((n, len(GREEK_COLS)))
+        self.leg_mtm = np.zeros(n)
+        self.net_greeks = np.zeros(len(GREEK_COLS))
+        self.net_mtm = 0.0
+
+    def load_positions(self, positions, managers):
+        # Map every position to its chain row and token once; ticks then only touch the affected legs.
+        # managers are keyed by (index, expiry), nearest expiry first. A position is matched by its token
+        # in any chain, else by (symbol, expiry, strike, type); one without an expiry (e.g. the demo file)
+        # is taken as the nearest expiry of its index. Anything else is skipped, never moved to another contract
+        token_managers = {token: m for m in managers.values() for token in m.token_map}
+        mapped = []
+        for pos in positions:
+            symbol = pos.get('symbol')
+            token = pos.get('token')
+            manager = token_managers.get(token)
+            if manager is not None:
+                strike, otype = manager.token_map[token]
+            else:
+                expiry = pos.get('expiry')
+                if expiry:
+                    manager = managers.get((symbol, expiry))
+                else:
+                    manager = next((m for (s, _), m in managers.items() if s == symbol), None)
+                strike, otype = float(pos['strike']), pos['option_type']
+                token = None
+                if manager is not None and strike in manager.full_chain.index:
+                    token = manager.full_chain.loc[strike, f'{otype}_token']
+            if token is None or pd.isnull(token):
+                logging.warning(f"No tracked contract for position {symbol} {pos.get('expiry')} {pos.get('strike')} {pos.get('option_type')}, skipping")
+                continue
+            mapped.append((pos, manager, token, float(strike), otype))
+
+        self.positions = [m[0] for m in mapped]
+        self._allocate(len(mapped))
+        self.token_legs, self.index_legs = {}, {}
+        manager_legs = {} # (index, expiry) -> (manager, leg indices)
+        for i, (pos, manager, token, strike, otype) in enumerate(mapped):
+            self.symbols[i] = manager.index_symbol
+            self.tokens[i] = token
+            self.rows[i] = manager.full_chain.index.get_loc(strike)
+            self.strikes[i] = strike
+            self.is_call[i] = otype == 'CE'
+            self.qty[i] = float(pos['qty'])
+            self.avg_price[i] = float(pos.get('avg_price', 0))
+            self.expiries[i] = manager.expiry
+            self.expiry_ts[i] = time.time() + years_to_expiry(manager.expiry, self.default_days) * SECONDS_PER_YEAR
+            self.token_legs.setdefault(token, []).append(i)
+            self.index_legs.setdefault(manager.index_symbol, []).append(i)
+            manager_legs.setdefault((manager.index_symbol, manager.expiry), (manager, []))[1].append(i)
+        self.token_legs = {k: np.array(v) for k, v in self.token_legs.items()}
+        self.index_legs = {k: np.array(v) for k, v in self.index_legs.items()}
+
+        for manager, legs in manager_legs.values():
+            self.refresh_from_chain(manager, np.array(legs))
+        self.resync()
+
+    def refresh_from_chain(self, manager, legs):
+        # Pull LTP/IV for legs on this manager's chain straight from their chain rows
+        if len(legs) == 0:
+            return
+        chain = manager.full_chain
+        rows = self.rows[legs]
+        calls = self.is_call[legs]
+        self.spot[legs] = manager.spot_price
+        self.ltp[legs] = np.where(calls, chain['CE_LTP'].values[rows], chain['PE_LTP'].values[rows])
+        chain_iv = np.where(calls, chain['CE_IV'].values[rows], chain['PE_IV'].values[rows]) / 100
+        self.iv[legs] = np.where(chain_iv > 0, chain_iv, self.iv[legs])
+        self._revalue(legs)
+
+    def on_tick(self, tick):
+        token = tick.get('token')
+        if token in self.index_legs:
+            # Underlying tick (token is the index symbol)
+            self.update_spot(token, tick.get('lp', 0))
+            return
+        legs = self.token_legs.get(token)
+        if legs is None:
+            return
+        ltp = tick.get('lp', 0)
+        if ltp <= 0:
+            return
+        i = legs[0]
+        otype = 'CE' if self.is_call[i] else 'PE'
+        self._update_t_years(legs)
+        iv = find_iv(ltp, self.spot[i], self.strikes[i], self.t_years[i], self.r, otype)
+        self.ltp[legs] = ltp
+        self.iv[legs] = iv
+        self._revalue(legs)
+
+    def update_spot(self, index_symbol, spot):
+        # A spot move changes every leg on that index, so those legs are revalued together
+        legs = self.index_legs.get(index_symbol)
+        if legs is None or spot <= 0 or spot == self.spot[legs[0]]:
+            return
+        self.spot[legs] = spot
+        self._revalue(legs)
+
+    def _update_t_years(self, legs):
+        # Time to expiry decays during the session, so it is recomputed whenever legs are revalued
+        self.t_years[legs] = np.maximum((self.expiry_ts[legs] - time.time()) / SECONDS_PER_YEAR, 0.0001)
+
+    def _revalue(self, legs):
+        self._update_t_years(legs)
+        _, delta, gamma, vega, theta = black_scholes_vec(self.spot[legs], self.strikes[legs], self.t_years[legs],
+                                                         self.r, self.iv[legs], self.is_call[legs])
+        greeks = np.column_stack([delta, gamma, vega, theta]) * self.qty[legs, None]
+        mtm = (self.ltp[legs] - self.avg_price[legs]) * self.qty[legs]
+        # Apply only the change in the affected legs' contributions to the running totals
+        self.net_greeks += (greeks - self.leg_greeks[legs]).sum(axis=0)
+        self.net_mtm += float((mtm - self.leg_mtm[legs]).sum())
+        self.leg_greeks[legs] = greeks
+        self.leg_mtm[legs] = mtm
+        self.version += 1
+
+    def resync(self):
+        # Revalue every leg at the current time to expiry (legs without ticks still decay), then
+        # re-sum in full to clear any floating point drift from incremental updates
+        if len(self.positions):
+            self._revalue(np.arange(len(self.positions)))
+        self.net_greeks = self.leg_greeks.sum(axis=0)
+        self.net_mtm = float(self.leg_mtm.sum())
+        self.version += 1
+
+    def get_summary(self):
+        summary = dict(zip(GREEK_COLS, self.net_greeks * GREEK_SCALE))
+        summary['MTM'] = self.net_mtm
+        return summary
+
+    def get_legs_frame(self):
+        df = pd.DataFrame({
+            'Symbol': self.symbols,
+            'Expiry': self.expiries,
+            'Strike': self.strikes,
+            'Type': np.where(self.is_call, 'CE', 'PE'),
+            'Qty': self.qty,
+            'Avg': self.avg_price,
+            'LTP': self.ltp,
+            'IV': np.round(self.iv * 100, 2),
+            'MTM': self.leg_mtm,
+        })
+        greeks = self.leg_greeks * GREEK_SCALE
+        for j, col in enumerate(GREEK_COLS):
+            df[col] = greeks[:, j]
+        return df
+
+    def get_scenario_legs(self, index_symbol, expiry=None):
+        legs = [i for i in self.index_legs.get(index_symbol, []) if expiry is None or self.expiries[i] == expiry]
+        return [{'strike': self.strikes[i], 'option_type': 'CE' if self.is_call[i] else 'PE', 'qty': self.qty[i]} for i in legs]
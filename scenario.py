@@ -0,0 +1,131 @@
+import logging
+import pandas as pd
+import numpy as np
+from concurrent.futures.process import BrokenProcessPool
+from analytics import black_scholes_vec, find_iv
+
+# Default grid: 51 spot shocks x 21 IV shocks x 10 days forward
+DEFAULT_SPOT_SHOCKS = np.linspace(-0.05, 0.05, 51) # fraction of spot
+DEFAULT_IV_SHOCKS = np.linspace(-0.10, 0.10, 21) # absolute vol points (0.01 = 1%)
+DEFAULT_DAYS_FORWARD = np.arange(10)
+
+GREEKS = ['delta', 'gamma', 'vega', 'theta']
+
+def revalue_grid(spot, strikes, is_call, qty, ltp, iv, t_years, spot_shocks, iv_shocks, days_forward, r=0.07):
+    # Broadcast shape: (spot, iv, days, legs); legs are summed out at the end
+    S = (spot * (1 + np.asarray(spot_shocks, dtype=float)))[:, None, None, None]
+    sigma = np.maximum(iv[None, None, None, :] + np.asarray(iv_shocks, dtype=float)[None, :, None, None], 0.01)
+    T = np.maximum(t_years[None, None, None, :] - np.asarray(days_forward, dtype=float)[None, None, :, None] / 365.0, 0.0001)
+
+    price, delta, gamma, vega, theta = black_scholes_vec(S, strikes, T, r, sigma, is_call)
+    return {
+        'pnl': ((price - ltp) * qty).sum(axis=-1),
+        'delta': (delta * qty).sum(axis=-1),
+        'gamma': (gamma * qty).sum(axis=-1),
+        'vega': (vega * qty).sum(axis=-1),
+        'theta': (theta * qty).sum(axis=-1),
+    }
+
+class ScenarioEngine:
+    def __init__(self, r=0.07, analytics=None, parallel_threshold=5_000_000):
+        self.r = r
+        # Grids with more revaluations (spot x iv x days x legs) than this are split across the
+        # process pool of `analytics` (a ParallelAnalytics); without one every grid runs in-process
+        self.analytics = analytics
+        self.parallel_threshold = parallel_threshold
+        self._cache_key = None
+        self._cache = None
+
+    def legs_from_chain(self, manager, legs, t_days=None):
+        # legs: list of {'strike', 'option_type', 'qty'}; LTP and IV come from the live chain
+        # t_days overrides the chain's own time to expiry
+        chain = manager.full_chain
+        T = manager.time_to_expiry(t_days)
+        strikes, is_call, qty, ltp, iv = [], [], [], [], []
+        for leg in legs:
+            strike = float(leg['strike'])
+            otype = leg['option_type']
+            if strike not in chain.index:
+                logging.warning(f"Scenario leg {strike} {otype} not in {manager.index_symbol} chain, skipping")
+                continue
+            leg_ltp = float(chain.loc[strike, f'{otype}_LTP'])
+            leg_iv = float(chain.loc[strike, f'{otype}_IV']) / 100
+            if leg_iv <= 0 and leg_ltp > 0:
+                leg_iv = find_iv(leg_ltp, manager.spot_price, strike, T, self.r, otype)
+            strikes.append(strike)
+            is_call.append(otype == 'CE')
+            qty.append(float(leg['qty']))
+            ltp.append(leg_ltp)
+            iv.append(leg_iv if leg_iv > 0 else 0.2)
+        return {
+            'strikes': np.array(strikes),
+            'is_call': np.array(is_call, dtype=bool),
+            'qty': np.array(qty),
+            'ltp': np.array(ltp),
+            'iv': np.array(iv),
+            't_years': np.full(len(strikes), T),
+        }
+
+    def run(self, manager, legs, spot_shocks=DEFAULT_SPOT_SHOCKS, iv_shocks=DEFAULT_IV_SHOCKS,
+            days_forward=DEFAULT_DAYS_FORWARD, t_days=None):
+        spot_shocks = np.asarray(spot_shocks, dtype=float)
+        iv_shocks = np.asarray(iv_shocks, dtype=float)
+        days_forward = np.asarray(days_forward, dtype=float)
+
+        # Reuse the last grid until the chain, legs, expiry or grid axes change. Keyed on the chain's
+        # version rather than the leg arrays: T from the expiry date moves with the clock on every call
+        key = (manager.index_symbol, manager.expiry, manager.version, t_days, self.r,
+               tuple((float(leg['strike']), leg['option_type'], float(leg['qty'])) for leg in legs),
+               spot_shocks.tobytes(), iv_shocks.tobytes(), days_forward.tobytes())
+        if key == self._cache_key:
+            return self._cache
+
+        leg_arrays = self.legs_from_chain(manager, legs, t_days)
+        result = self._revalue(manager.spot_price, leg_arrays, spot_shocks, iv_shocks, days_forward)
+        self._cache_key, self._cache = key, result
+        return result
+
+    def _revalue(self, spot, leg_arrays, spot_shocks, iv_shocks, days_forward):
+        grid_shape = (len(spot_shocks), len(iv_shocks), len(days_forward))
+        if len(leg_arrays['strikes']) == 0:
+            result = {name: np.zeros(grid_shape) for name in ['pnl'] + GREEKS}
+        elif self.analytics is not None and np.prod(grid_shape) * len(leg_arrays['strikes']) > self.parallel_threshold:
+            result = self._run_parallel(spot, leg_arrays, spot_shocks, iv_shocks, days_forward)
+        else:
+            result = revalue_grid(spot, **leg_arrays, spot_shocks=spot_shocks, iv_shocks=iv_shocks,
+                                  days_forward=days_forward, r=self.r)
+
+        result['spot_shocks'] = spot_shocks
+        result['iv_shocks'] = iv_shocks
+        result['days_forward'] = days_forward
+        result['spot'] = float(spot)
+        return result
+
+    def _run_parallel(self, spot, leg_arrays, spot_shocks, iv_shocks, days_forward):
+        # Split the spot axis into one chunk per worker and stitch the results back together
+        executor = self.analytics.get_executor()
+        n_chunks = min(len(spot_shocks), self.analytics.max_workers)
+        try:
+            futures = [
+                executor.submit(revalue_grid, spot, **leg_arrays, spot_shocks=chunk, iv_shocks=iv_shocks,
+                                days_forward=days_forward, r=self.r)
+                for chunk in np.array_split(spot_shocks, n_chunks)
+            ]
+            parts = [f.result() for f in futures]
+        except (BrokenProcessPool, RuntimeError) as e:
+            # Same recovery as the Greeks path: a dead worker or a pool discarded meanwhile runs the grid in-process
+            logging.error(f"Analytics process pool unavailable ({e!r}), revaluing the scenario grid in-process")
+            if isinstance(e, BrokenProcessPool):
+                self.analytics.discard_executor(executor)
+            return revalue_grid(spot, **leg_arrays, spot_shocks=spot_shocks, iv_shocks=iv_shocks,
+                                days_forward=days_forward, r=self.r)
+        return {name: np.concatenate([p[name] for p in parts], axis=0) for name in ['pnl'] + GREEKS}
+
+def grid_slice(result, value='pnl', iv_shock=0.0):
+    # Spot x days table at the IV shock closest to `iv_shock`
+    iv_idx = int(np.argmin(np.abs(result['iv_shocks'] - iv_shock)))
+    spots = np.round(result['spot'] * (1 + result['spot_shocks']), 2)
+    df = pd.DataFrame(result[value][:, iv_idx, :], index=spots, columns=result['days_forward'].astype(int))
+    df.index.name = 'Spot'
+    df.columns.name = 'Days Forward'
+    return df
@@ -0,0 +1,191 @@
+import time
+import logging
+import threading
+import numpy as np
+from analytics import black_scholes_vec, years_to_expiry
+
+TRADING_SECONDS_PER_YEAR = 252 * 375 * 60 # 252 sessions of 375 minutes
+CALENDAR_SECONDS_PER_YEAR = 365 * 86400
+
+class MarketSimulator:
+    """
+    Vectorized synthetic market for demo mode and load testing.
+    - Each underlying follows a GBM with Poisson jumps; ATM IV mean-reverts and moves against spot.
+    - Every contract is priced with Black-Scholes on a skew/smile IV surface, so prices stay
+      consistent with strike, type, spot and time to expiry.
+    - Trades arrive as Poisson counts concentrated near ATM and drive volume and OI.
+    """
+    def __init__(self, instruments_df, spot_prices, r=0.07, seed=None,
+                 spot_vol=0.15, jump_intensity=5.0, jump_std=0.005,
+                 atm_iv=0.14, iv_reversion=50.0, vol_of_vol=0.5, spot_iv_corr=-0.7,
+                 skew=-0.15, smile=0.6, trade_rate=2.0):
+        self.rng = np.random.default_rng(seed)
+        self.r = r
+        self.spot_vol = spot_vol
+        self.jump_intensity = jump_intensity # jumps per year
+        self.jump_std = jump_std
+        self.iv_reversion = iv_reversion
+        self.vol_of_vol = vol_of_vol
+        self.spot_iv_corr = spot_iv_corr
+        self.skew = skew
+        self.smile = smile
+        self.trade_rate = trade_rate # trades/sec for an ATM contract
+
+        # Underlyings
+        self.indices = list(spot_prices)
+        self.spot = np.array([spot_prices[s] for s in self.indices], dtype=float)
+        self.iv_mean = np.full(len(self.indices), atm_iv)
+        self.atm_iv = self.iv_mean.copy()
+
+        # Contracts
+        self.index_pos = {symbol: i for i, symbol in enumerate(self.indices)}
+        self.tokens = np.empty(0, dtype=object)
+        self.index_id = np.empty(0, dtype=int)
+        self.strikes = np.empty(0)
+        self.is_call = np.empty(0, dtype=bool)
+        self.t_years = np.empty(0)
+        self.oi = np.empty(0)
+        self.volume = np.empty(0)
+        self.token_pos = {}
+        self.active = np.empty(0, dtype=int) # positions of subscribed contracts
+        self._append_contracts(instruments_df)
+
+        self.ticks_emitted = 0
+        self._stop = threading.Event()
+        self._thread = None
+        # Sessions subscribe and add contracts concurrently to a shared simulator while it ticks
+        self._lock = threading.Lock()
+
+    def _append_contracts(self, instruments_df):
+        # Append contracts of the simulated indices that are not tracked yet; returns how many were added
+        df = instruments_df[instruments_df['symbol'].isin(self.indices) & ~instruments_df['instrument_token'].isin(list(self.token_pos))]
+        df = df.drop_duplicates('instrument_token')
+        if df.empty:
+            return 0
+        index_id = df['symbol'].map(self.index_pos).to_numpy()
+        strikes = df['strike_price'].to_numpy(dtype=float)
+        expiry_years = {e: years_to_expiry(e) for e in df['expiry'].unique()}
+        # Initial OI peaks around ATM; volume starts at zero for the session
+        moneyness = np.log(strikes / self.spot[index_id])
+        oi = np.round(100000 * np.exp(-0.5 * (moneyness / 0.03) ** 2) + 5000 * self.rng.random(len(df)))
+
+        start = len(self.tokens)
+        self.tokens = np.concatenate([self.tokens, df['instrument_token'].to_numpy(dtype=object)])
+        self.index_id = np.concatenate([self.index_id, index_id])
+        self.strikes = np.concatenate([self.strikes, strikes])
+        self.is_call = np.concatenate([self.is_call, (df['option_type'] == 'CE').to_numpy()])
+        self.t_years = np.concatenate([self.t_years, df['expiry'].map(expiry_years).to_numpy(dtype=float)])
+        self.oi = np.concatenate([self.oi, oi])
+        self.volume = np.concatenate([self.volume, np.zeros(len(df))])
+        self.token_pos.update((token, start + i) for i, token in enumerate(self.tokens[start:]))
+        self._reprice()
+        return len(df)
+
+    def add_contracts(self, instruments_df):
+        # Sessions started after a weekly roll bring expiries the simulator was not built with
+        with self._lock:
+            added = self._append_contracts(instruments_df)
+        if added:
+            logging.info(f"Simulator now tracks {added} more contracts")
+
+    def subscribe(self, tokens):
+        tokens = list(tokens)
+        positions = [self.token_pos[t] for t in tokens if t in self.token_pos]
+        if len(positions) < len(tokens):
+            unknown = [t for t in tokens if t not in self.token_pos]
+            logging.warning(f"Simulator has no contract for {len(unknown)} subscribed tokens (e.g. {unknown[0]}), they will not tick")
+        with self._lock:
+            self.active = np.union1d(self.active, np.array(positions, dtype=int))
+
+    def _reprice(self):
+        S = self.spot[self.index_id]
+        T = self.t_years
+        # IV surface: ATM level plus skew and smile in standardized moneyness
+        m = np.log(self.strikes / S) / np.sqrt(T)
+        self.iv = np.clip(self.atm_iv[self.index_id] + self.skew * m + self.smile * m ** 2, 0.03, 2.0)
+        price, _, _, _, _ = black_scholes_vec(S, self.strikes, T, self.r, self.iv, self.is_call)
+        # Round to the 0.05 exchange tick, with a spread that widens for pricier contracts
+        self.ltp = np.maximum(np.round(price / 0.05) * 0.05, 0.05)
+        half_spread = np.maximum(np.round(self.ltp * 0.0025 / 0.05) * 0.05, 0.05)
+        self.bp = np.maximum(self.ltp - half_spread, 0.0)
+        self.ap = self.ltp + half_spread
+
+    def step(self, dt):
+        # Advance the market by dt seconds
+        n = len(self.indices)
+        dt_years = dt / TRADING_SECONDS_PER_YEAR
+        z = self.rng.standard_normal(n)
+        n_jumps = self.rng.poisson(self.jump_intensity * dt_years, n)
+        jumps = np.sqrt(n_jumps) * self.jump_std * self.rng.standard_normal(n)
+        self.spot *= np.exp(-0.5 * self.spot_vol ** 2 * dt_years + self.spot_vol * np.sqrt(dt_years) * z + jumps)
+
+        z_iv = self.spot_iv_corr * z + np.sqrt(1 - self.spot_iv_corr ** 2) * self.rng.standard_normal(n)
+        self.atm_iv += self.iv_reversion * (self.iv_mean - self.atm_iv) * dt_years + self.vol_of_vol * np.sqrt(dt_years) * z_iv
+        self.atm_iv = np.clip(self.atm_iv, 0.05, 1.0)
+
+        self.t_years = np.maximum(self.t_years - dt / CALENDAR_SECONDS_PER_YEAR, 0.0001)
+        self._reprice()
+
+        # Trades: Poisson counts, most activity near ATM; each trade opens or closes a contract
+        moneyness = np.log(self.strikes / self.spot[self.index_id])
+        activity = self.trade_rate * np.exp(-0.5 * (moneyness / 0.02) ** 2) + 0.05
+        trades = self.rng.poisson(activity * dt)
+        opened = self.rng.binomial(trades, 0.52)
+        self.volume += trades
+        self.oi = np.maximum(self.oi + 2 * opened - trades, 0)
+
+    def emit(self, n_ticks):
+        # Build a batch of n_ticks option ticks (random subscribed contracts) plus one spot tick per index
+        ts = time.time()
+        batch = [{'token': symbol, 'lp': float(spot), 'ts': ts} for symbol, spot in zip(self.indices, self.spot)]
+        if len(self.active) == 0:
+            return batch
+        pos = self.rng.choice(self.active, n_ticks)
+        batch.extend(
+            {'token': token, 'lp': lp, 'oi': oi, 'v': v, 'bp': bp, 'ap': ap, 'ts': ts}
+            for token, lp, oi, v, bp, ap in zip(self.tokens[pos], self.ltp[pos].tolist(), self.oi[pos].astype(int).tolist(),
+                                               self.volume[pos].astype(int).tolist(), self.bp[pos].tolist(), self.ap[pos].tolist())
+        )
+        self.ticks_emitted += len(batch)
+        return batch
+
+    def generate(self, n_batches, batch_size, interval=0.1):
+        # Offline tick stream for benchmarks: no sleeping, simulated clock advances by interval per batch
+        for _ in range(n_batches):
+            with self._lock:
+                self.step(interval)
+                batch = self.emit(batch_size)
+            yield batch
+
+    def start(self, sink, rate=500, interval=0.1):
+        # Emit rate ticks/sec to sink(batch) from a daemon thread, one batch every interval seconds
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(sink, rate, interval), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, sink, rate, interval):
+        batch_size = max(1, int(round(rate * interval)))
+        last = time.perf_counter()
+        next_batch = last
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            with self._lock:
+                self.step(now - last)
+                batch = self.emit(batch_size)
+            last = now
+            try:
+                sink(batch)
+            except Exception as e:
+                logging.error(f"Simulator sink error: {e}")
+            next_batch += interval
+            delay = next_batch - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                # Falling behind the requested rate: drop the backlog instead of bursting
+                next_batch = time.perf_counter()
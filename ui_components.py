@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
+
+# plotly is imported inside the chart builders so it only loads when a chart view is opened
 
 def render_metric_cards(spot, atm, pcr, max_pain, support, resistance):
     col1, col2, col3, col4, col5, col6 = st.columns(6)
@@ -12,7 +12,7 @@ def render_metric_cards(spot, atm, pcr, max_pain, support, resistance):
     col5.metric("Support", f"{int(support)}")
     col6.metric("Resistance", f"{int(resistance)}")
 
-def render_option_chain_table(df, atm_strike):
+def prepare_option_chain_table(df):
     # Prepare table for display
     # CE on left, Strike in middle, PE on right
     display_df = pd.DataFrame(index=df.index)
@@ -30,56 +30,130 @@ def render_option_chain_table(df, atm_strike):
     
     # Reorder columns
     cols = ['CE_Delta', 'CE_IV', 'CE_OI', 'CE_CHG_OI', 'CE_LTP', 'Strike', 'PE_LTP', 'PE_CHG_OI', 'PE_OI', 'PE_IV', 'PE_Delta']
-    display_df = display_df[cols]
-    
+    return display_df[cols]
+
+def build_option_chain_table(df, atm_strike):
+    display_df = prepare_option_chain_table(df)
+
     # Style: highlight ATM
     def highlight_atm(s):
         return ['background-color: #333333' if s.name == atm_strike else '' for _ in s]
 
-    st.dataframe(display_df.style.apply(highlight_atm, axis=1), use_container_width=True, height=500)
+    return display_df.style.apply(highlight_atm, axis=1)
+
+def render_option_chain_table(styled):
+    # styled comes from build_option_chain_table, so callers can reuse it while the chain is unchanged
+    st.dataframe(styled, use_container_width=True, height=500)
+
+def build_oi_figures(df):
+    import plotly.graph_objects as go
+    import plotly.express as px
+
+    # OI vs Strike Bar Chart
+    oi_fig = go.Figure()
+    oi_fig.add_trace(go.Bar(x=df.index, y=df['CE_OI'], name='Call OI', marker_color='red'))
+    oi_fig.add_trace(go.Bar(x=df.index, y=df['PE_OI'], name='Put OI', marker_color='green'))
+    oi_fig.update_layout(title="OI vs Strike", barmode='group', height=400)
+
+    # Change in OI vs Strike
+    chg_fig = go.Figure()
+    chg_fig.add_trace(go.Bar(x=df.index, y=df['CE_CHG_OI'], name='Call OI Chg', marker_color='darkred'))
+    chg_fig.add_trace(go.Bar(x=df.index, y=df['PE_CHG_OI'], name='Put OI Chg', marker_color='darkgreen'))
+    chg_fig.update_layout(title="Change in OI vs Strike", barmode='group', height=400)
+
+    # Total OI Pie Chart
+    total_ce = df['CE_OI'].sum()
+    total_pe = df['PE_OI'].sum()
+    pie_fig = px.pie(values=[total_ce, total_pe], names=['Total Call OI', 'Total Put OI'], 
+                     color_discrete_sequence=['red', 'green'], title="OI Dominance")
+    pie_fig.update_layout(height=400)
+
+    # Simple Intraday PCR Line (Mocking trend with random variations around current PCR)
+    pcr = total_pe / total_ce if total_ce > 0 else 1
+    pcr_trend = [pcr * (1 + (i-5)*0.01) for i in range(10)]
+    pcr_fig = px.line(x=range(10), y=pcr_trend, title="Intraday PCR Trend (Simulated)")
+    pcr_fig.update_layout(height=400)
+
+    return oi_fig, chg_fig, pie_fig, pcr_fig
+
+def render_oi_charts(figures):
+    # figures comes from build_oi_figures
+    oi_fig, chg_fig, pie_fig, pcr_fig = figures
 
-def render_oi_charts(df):
     col1, col2 = st.columns(2)
-    
     with col1:
-        # OI vs Strike Bar Chart
-        fig = go.Figure()
-        fig.add_trace(go.Bar(x=df.index, y=df['CE_OI'], name='Call OI', marker_color='red'))
-        fig.add_trace(go.Bar(x=df.index, y=df['PE_OI'], name='Put OI', marker_color='green'))
-        fig.update_layout(title="OI vs Strike", barmode='group', height=400)
-        st.plotly_chart(fig, use_container_width=True)
-
+        st.plotly_chart(oi_fig, use_container_width=True)
     with col2:
-        # Change in OI vs Strike
-        fig = go.Figure()
-        fig.add_trace(go.Bar(x=df.index, y=df['CE_CHG_OI'], name='Call OI Chg', marker_color='darkred'))
-        fig.add_trace(go.Bar(x=df.index, y=df['PE_CHG_OI'], name='Put OI Chg', marker_color='darkgreen'))
-        fig.update_layout(title="Change in OI vs Strike", barmode='group', height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(chg_fig, use_container_width=True)
 
     col3, col4 = st.columns(2)
     with col3:
-        # Total OI Pie Chart
-        total_ce = df['CE_OI'].sum()
-        total_pe = df['PE_OI'].sum()
-        fig = px.pie(values=[total_ce, total_pe], names=['Total Call OI', 'Total Put OI'], 
-                     color_discrete_sequence=['red', 'green'], title="OI Dominance")
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
-
+        st.plotly_chart(pie_fig, use_container_width=True)
     with col4:
-        # Simple Intraday PCR Line (Mocking trend with random variations around current PCR)
-        pcr = total_pe / total_ce if total_ce > 0 else 1
-        pcr_trend = [pcr * (1 + (i-5)*0.01) for i in range(10)]
-        fig = px.line(x=range(10), y=pcr_trend, title="Intraday PCR Trend (Simulated)")
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
-
-def render_oi_heatmap(df):
+        st.plotly_chart(pcr_fig, use_container_width=True)
+
+def build_oi_heatmap(df):
+    import plotly.express as px
+
     # Simple heatmap of OI
-    fig = px.imshow([df['CE_OI'].values, df['PE_OI'].values], 
-                    labels=dict(x="Strike", y="Option Type", color="OI"),
-                    x=df.index, y=['CE', 'PE'],
-                    color_continuous_scale='RdYlGn',
-                    title="OI Heatmap")
+    return px.imshow([df['CE_OI'].values, df['PE_OI'].values], 
+                     labels=dict(x="Strike", y="Option Type", color="OI"),
+                     x=df.index, y=['CE', 'PE'],
+                     color_continuous_scale='RdYlGn',
+                     title="OI Heatmap")
+
+def render_oi_heatmap(fig):
+    st.plotly_chart(fig, use_container_width=True)
+
+def render_scenario_heatmap(pnl_df):
+    import plotly.express as px
+
+    # P&L over spot (rows) x days forward (columns)
+    fig = px.imshow(pnl_df.values,
+                    labels=dict(x="Days Forward", y="Spot", color="P&L"),
+                    x=pnl_df.columns, y=pnl_df.index,
+                    color_continuous_scale='RdYlGn', color_continuous_midpoint=0,
+                    aspect='auto', title="Scenario P&L (Spot x Days)")
+    fig.update_layout(height=500)
     st.plotly_chart(fig, use_container_width=True)
+
+def render_portfolio(summary, legs_df):
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Net Delta", f"{summary['Delta']:,.2f}")
+    col2.metric("Net Gamma", f"{summary['Gamma']:,.4f}")
+    col3.metric("Net Vega/vol pt", f"{summary['Vega']:,.2f}")
+    col4.metric("Net Theta/day", f"{summary['Theta']:,.2f}")
+    col5.metric("MTM", f"{summary['MTM']:,.2f}")
+    st.dataframe(legs_df.round(4), use_container_width=True, hide_index=True)
+
+def render_metrics_panel(rows):
+    # Latencies are in seconds; p50/p99 are histogram bucket upper bounds
+    if not rows:
+        st.caption("No metrics recorded yet.")
+        return
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+def render_history(iv, oi_change, pcr_tod, intraday, sessions):
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("ATM IV", f"{iv['current']:.2f}" if pd.notnull(iv['current']) else "-")
+    col2.metric("IV Percentile", f"{iv['percentile']:.0f}" if pd.notnull(iv['percentile']) else "-")
+    col3.metric("IV Rank", f"{iv['rank']:.0f}" if pd.notnull(iv['rank']) else "-")
+    col4.metric("Sessions Stored", iv['sessions'])
+
+    if not intraday.empty:
+        st.subheader("Today: ATM IV and PCR by minute")
+        st.line_chart(intraday.set_index('minute')[['atm_iv', 'pcr']])
+
+    st.subheader(f"OI Change by Strike (last {sessions} sessions)")
+    if oi_change.empty:
+        st.caption("No session closes recorded yet.")
+    else:
+        st.caption(f"Expiry {oi_change.attrs['expiry']}: {oi_change.attrs['from']} to {oi_change.attrs['to']}")
+        st.bar_chart(oi_change)
+
+    st.subheader("PCR by Time of Day")
+    if pcr_tod.empty:
+        st.caption("No PCR history recorded yet.")
+    else:
+        st.line_chart(pcr_tod.set_index('time')[['p10', 'p50', 'p90', 'mean']])
+        st.dataframe(pcr_tod.round(3), use_container_width=True, hide_index=True)
@@ -59,6 +59,16 @@ def update_history(current_history, new_df, max_points=100):
     
     return updated_history
 
+def data_signature(df):
+    """
+    Returns a hash of the snapshot's price/volume columns.
+    Used to detect whether a fetch returned new data before touching history.
+    """
+    if df is None or df.empty:
+        return None
+    cols = [c for c in ['symbol', 'lastPrice', 'totalTradedVolume'] if c in df.columns]
+    return int(pd.util.hash_pandas_object(df[cols], index=False).sum())
+
 def get_top_gainers(df, n=5):
     if df.empty: return pd.DataFrame()
     return df.sort_values(by='pChange', ascending=False).head(n)